@@ -17,14 +17,18 @@ TO RUN:
           -  out_proj = 26915 - EPSG id for NAD83 UTM 15N projected coordinate system with units in meters
                 (https://epsg.io/26915)
           -  grid_spacing = 500 - assigned as the default grid spacing in meters
+          -  clip_to_polygon = False - set True to keep only the grid points inside the bounding polygon
+          -  pause_between_stages = True - set False to run without the "Press Enter" pauses (see gridcli.py for
+                unattended batch runs)
           -  grid_nparray - modify to change the variable name of the numpy array output grid
     -   Run the code
 
 DATA FORMAT:    Manual input
 
-REQUIRES:       os, pathlib, geopandas, pyproj, shapely, numpy
+REQUIRES:       os, pathlib, geopandas, shapely, numpy, gridengine, gridwriters, lazygrid, polyclip,
+                projcache (pyproj)
 
-TODO:           1) implement polygon generation
+TODO:           N/A
 
 AUTHOR:         Harris Bienn
 
@@ -38,9 +42,14 @@ CONTACT:        hbienn@thewaterinstitute.org
 import os
 from pathlib import Path
 import geopandas as gpd
-from pyproj import CRS, Transformer
 import shapely.geometry as geo
 import numpy as np
+import shapely
+import gridengine
+import gridwriters
+import projcache
+from lazygrid import LazyGrid
+from polyclip import ClippedGrid
 
 
 # Define Formatting Classes
@@ -60,22 +69,31 @@ out_path = str(os.path.join(Path.home(), "Documents") + "\\grid.csv")
 in_epsg = 4326
 out_epsg = 26915
 grid_spacing = 500
+clip_to_polygon = False
+pause_between_stages = True
+
+
+def pause():
+    # Wait for the user between stages unless running unattended
+    if pause_between_stages:
+        input("Press Enter to continue...")
+
 
 # Inform directory location of selected file
 print("The directory location of the file you have selected is:", "\n")
 print(c.BD + in_path + c.END, "\n")
-input("Press Enter to continue...")
+pause()
 
 # Read GeoJSON into GeoDataFrame and make copy for geometry conversion
 gdf = gpd.read_file(in_path)
 
 print("Your input represented as a GeoDataFrame:", "\n")
 print(c.BD + str(gdf) + c.END, "\n")
-input("Press Enter to continue...")
+pause()
 
 # Define input and output coordinate systems
-in_proj = CRS.from_user_input(in_epsg)
-out_proj = CRS.from_user_input(out_epsg)
+in_proj = projcache.get_crs(in_epsg)
+out_proj = projcache.get_crs(out_epsg)
 
 print("YOUR" + c.BD + c.C + " INPUT " + c.END + "COORDINATE SYSTEM IS: "
       + c.BD + c.R + str(in_proj) + c.END, "\n")
@@ -83,12 +101,12 @@ print(c.C + str(in_proj.to_wkt(pretty=True)) + c.END, "\n")
 print("YOUR" + c.BD + c.B + " OUTPUT " + c.END + "COORDINATE SYSTEM IS: "
       + c.BD + c.R + str(out_proj) + c.END, "\n")
 print(c.B + str(out_proj.to_wkt(pretty=True)) + c.END, "\n")
-input("Press Enter to continue...")
+pause()
 
 # Grid resolution messages
 print("You have selected " + c.BD + c.R + str(grid_spacing) + c.END +
       " meters as your desired grid resolution" + c.END, "\n")
-input("Press Enter to continue...")
+pause()
 
 # Turn bounding box polygon vertices into points
 bounds = gdf.bounds  # Returns tuple minx, miny, maxx, maxy of bounding box
@@ -109,10 +127,10 @@ print("The updated geometry and location for the SOUTHWEST point of your boundin
       str(sw) + c.END, "\n")
 print("The updated geometry and location for the NORTHEAST point of your bounding box is:", c.BD + c.G +
       str(ne) + c.END, "\n")
-input("Press Enter to continue...")
+pause()
 
 # Define coordinate system for transformer
-transformer = Transformer.from_crs(in_proj, out_proj, always_xy=True)
+transformer = projcache.get_transformer(in_epsg, out_epsg)
 
 print(c.UL + "Function will now transform p from", str(in_proj), "to", str(out_proj) + c.END, "\n")
 
@@ -124,7 +142,7 @@ print("The transformed location for the SOUTHWEST point of your grid is:", c.BD
       str(transformed_sw) + c.END, "\n")
 print("The transformed location for the NORTHEAST point of your grid is:", c.BD + c.G +
       str(transformed_ne) + c.END, "\n")
-input("Press Enter to continue...")
+pause()
 
 # Iterate points over 2D area
 print("Iterating grid starting at" + c.BD + " SOUTHWEST " + c.END + "origin point at a resolution of "
@@ -149,12 +167,24 @@ grid_nparray = np.array(list_array)
 print(c.UL + "Array generation complete:" + c.END, "\n")
 print(grid_nparray)
 print("Your output can be called by via the " + c.BD + "grid_np_array" + c.END + " variable", "\n")
-input("Press Enter to continue...")
-
-# Create plaintext output
-with open(out_path, 'w') as of:
-    of.write('easting,northing\n')
-    for p in grid_points:
-        of.write('{:f},{:f}\n'.format(p.x, p.y))
+pause()
+
+# Clip grid to the bounding polygon, filling the inside span of each grid column rather than testing every point
+if clip_to_polygon:
+    footprint = shapely.transform(gdf.geometry.iloc[0], transformer.transform, interleaved=False)
+    grid_nparray = ClippedGrid(LazyGrid.from_corners(transformed_sw, transformed_ne, int(grid_spacing)),
+                               footprint).to_numpy()
+
+    print(c.UL + "Grid clipped to your bounding polygon:" + c.END, "\n")
+    print(grid_nparray)
+    pause()
+
+# Create plaintext output, formatting each easting and northing once rather than once per point
+if clip_to_polygon:
+    gridwriters.write_csv(out_path, [grid_nparray])
+else:
+    xs = gridengine.axis(transformed_sw[0], transformed_ne[0], int(grid_spacing))
+    ys = gridengine.axis(transformed_sw[1], transformed_ne[1], int(grid_spacing))
+    gridwriters.write_lattice_csv(out_path, xs, ys)
 
 print(c.BD + c.G + "Grid generation complete" + c.END)
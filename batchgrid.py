@@ -0,0 +1,138 @@
+"""
+NAME:           batchgrid.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Grids every feature (or a selected list of feature IDs) of the input GeoJSON in one run, spreading the
+features across a process pool. The input is read and the CRS set up once per process rather than once per tile.
+Outputs either one file per feature or a single merged plaintext file with a leading feature_id column.
+
+TO RUN:
+    -   Modify function values as desired. Default variable assignments:
+          -  in_path - attempts to locate "boundingbox.geojson" in your downloads folder
+          -  out_path - saves "grid.csv" to your documents folder. Per-feature outputs are named grid_<ID>.csv
+                alongside it (characters other than letters, digits, '.', '-' and '_' in the ID become '_'); any output
+                format supported by gridwriters.py can be used
+          -  in_epsg = 4326, out_epsg = 26915, grid_spacing = 500 - as for pocketgrid.grid
+          -  ids = None - list of feature IDs to grid; None grids every feature
+          -  id_field = "ID" - attribute holding the feature ID (falls back to the row number if missing)
+          -  merge = False - set True to write one plaintext file with a feature_id column instead of one per feature
+          -  workers = None - number of worker processes, defaults to the number of CPUs
+          -  clip = False - set True to keep only the nodes inside each feature's polygon
+    -   Run the code
+
+DATA FORMAT:    Manual input
+
+REQUIRES:       os, re, shutil, tempfile, concurrent.futures, geopandas, shapely, numpy, gridwriters, lazygrid,
+                polyclip, projcache (pyproj)
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import gridwriters
+import projcache
+from lazygrid import LazyGrid
+from polyclip import ClippedGrid
+
+
+def features(in_path, ids=None, id_field="ID"):
+    # (feature_id, (minx, miny, maxx, maxy), geometry) for each selected feature, in file order
+    import geopandas as gpd
+    gdf = gpd.read_file(in_path)
+    feature_ids = gdf[id_field].tolist() if id_field in gdf.columns else list(range(len(gdf)))
+    wanted = None if ids is None else {str(i) for i in ids}
+    bounds = np.array(gdf.bounds)
+    return [(feature_id, tuple(bounds[i]), gdf.geometry.iloc[i]) for i, feature_id in enumerate(feature_ids)
+            if wanted is None or str(feature_id) in wanted]
+
+
+def feature_path(out_path, feature_id, used=None):
+    # <root>_<ID><ext> with anything but letters, digits, '.', '-' and '_' in the ID replaced by '_', so an ID such as
+    # "a/b" or "../x" cannot leave the output folder. IDs that end up the same (also ignoring case) get _2, _3...
+    # suffixes when the names already taken are passed in `used`, which is updated.
+    root, ext = gridwriters.split_extension(out_path)
+    name = re.sub(r'[^\w.-]', '_', str(feature_id))
+    path, n = f"{root}_{name}{ext}", 1
+    while used is not None and path.lower() in used:
+        n += 1
+        path = f"{root}_{name}_{n}{ext}"
+    if used is not None:
+        used.add(path.lower())
+    return path
+
+
+def _grid_feature(job):
+    transformer = projcache.get_transformer(job['in_epsg'], job['out_epsg'])  # Built once per worker process
+    minx, miny, maxx, maxy = job['bounds']
+    transformed_sw = transformer.transform(minx, miny)  # Transforms SW corner point to target CRS
+    transformed_ne = transformer.transform(maxx, maxy)  # Transforms NE corner point to target CRS
+    source = LazyGrid.from_corners(transformed_sw, transformed_ne, int(job['grid_spacing']), epsg=job['out_epsg'],
+                                   dtype=job['dtype'])
+    if job['clip']:
+        import shapely
+        source = ClippedGrid(source, shapely.transform(job['geometry'], transformer.transform, interleaved=False))
+    gridwriters.write(job['path'], source.iter_blocks(), source.meta, fmt=job['out_format'], dtype=job['dtype'],
+                      precision=job['precision'], header=job['header'], prefix=job['prefix'])
+    return {'feature_id': job['feature_id'], 'path': job['path'], 'count': len(source)}
+
+
+def batch(in_path=str(os.path.join(Path.home(), "Downloads") + "\\boundingbox.geojson"),
+          out_path=str(os.path.join(Path.home(), "Documents") + "\\grid.csv"),
+          in_epsg=4326,
+          out_epsg=26915,
+          grid_spacing=500,
+          ids=None,
+          id_field="ID",
+          merge=False,
+          workers=None,
+          clip=False,
+          dtype=np.float64,
+          precision=6,
+          out_format=None):
+    out_format = gridwriters.output_format(out_path, out_format)
+    if merge and out_format != 'csv':
+        raise ValueError("Merged output is written as plaintext; use per-feature files for binary formats")
+    selected = features(in_path, ids, id_field)
+    part_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(out_path))) if merge else None
+    jobs, used = [], set()
+    for n, (feature_id, bounds, geometry) in enumerate(selected):
+        jobs.append({'feature_id': feature_id, 'bounds': bounds, 'geometry': geometry if clip else None,
+                     'path': os.path.join(part_dir, f"{n}.part") if merge else feature_path(out_path, feature_id, used),
+                     'in_epsg': in_epsg, 'out_epsg': out_epsg, 'grid_spacing': grid_spacing, 'clip': clip,
+                     'dtype': dtype, 'precision': precision, 'out_format': out_format,
+                     'header': None if merge else gridwriters.CSV_HEADER, 'prefix': f"{feature_id}," if merge else ''})
+    try:
+        if workers == 1 or len(jobs) < 2:
+            results = [_grid_feature(job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_grid_feature, jobs))
+        if merge:  # Concatenate the per-feature parts in feature order under a single header
+            with open(out_path, 'w') as of:
+                of.write('feature_id,' + gridwriters.CSV_HEADER + '\n')
+                for result in results:
+                    with open(result['path']) as part:
+                        shutil.copyfileobj(part, of, 1 << 20)
+                    result['path'] = out_path
+    finally:
+        if part_dir is not None:
+            shutil.rmtree(part_dir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    batch()
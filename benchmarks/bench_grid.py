@@ -0,0 +1,207 @@
+"""
+NAME:           bench_grid.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Reproducible benchmark of grid generation and output. Needs no network or input data: each case writes
+a synthetic bounding box GeoJSON, a square centred on Baton Rouge sized in the output CRS so that the grid has the
+requested node count, and runs pocketgrid.grid on it in a fresh interpreter (no warm caches, peak memory per case;
+the heavy libraries are imported before the clock starts unless --cold is given).
+The default sweep covers 1e3 to 1e6 nodes in every output format at 500 m; a second sweep varies the spacing and
+EPSG pair at 1e5 nodes. --max-nodes 1e8 extends the first sweep. Records the best and median wall time, rows/sec,
+peak memory (process RSS high-water mark; tracemalloc peak with --tracemalloc), output size and per-stage times
+(see gridstats.py). Results are written as JSON; with --baseline each case is compared with the same case of an
+earlier results file and the run exits non-zero when one got slower or bigger than the thresholds allow.
+
+TO RUN:
+    -   python benchmarks/bench_grid.py [--max-nodes 1e6] [--formats csv npy] [--repeat 3] [--tracemalloc] [--cold]
+            [--json results.json]
+    -   python benchmarks/bench_grid.py --json new.json --baseline results.json [--time-threshold 0.1]
+            [--memory-threshold 0.2] [--min-delta-ms 5]
+
+DATA FORMAT:    {"environment": {...}, "results": [{"case", "nodes", "spacing", "in_epsg", "out_epsg", "format",
+"seconds", "median_seconds", "rows_per_sec", "peak_rss", "peak_traced", "bytes", "stages"}, ...]}
+
+REQUIRES:       argparse, json, math, os, platform, subprocess, sys, tempfile, numpy, pyproj (through projcache)
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+CENTER = (-91.192306, 30.432555)  # Baton Rouge, LA, the mapper's default view
+SIZES = [1e3, 1e4, 1e5, 1e6, 1e7, 1e8]
+FORMATS = ['csv', 'csv.gz', 'csv.xz', 'npy', 'npz', 'raw', 'parquet']
+EXTENSIONS = {'csv': '.csv', 'csv.gz': '.csv.gz', 'csv.xz': '.csv.xz', 'npy': '.npy', 'npz': '.npz', 'raw': '.f64',
+              'parquet': '.parquet'}
+SPACINGS = [500, 50, 5]
+EPSG_PAIRS = [(4326, 26915), (4326, 3857), (4269, 26915)]
+SWEEP_NODES = 1e5  # Node count of the spacing / EPSG pair sweep
+
+# Runs in a fresh interpreter: one timed grid() call, reported as JSON on the last line
+PROBE = """
+import json, os, sys, time
+sys.path.insert(0, {repo!r})
+import gridstats, pocketgrid
+if not {cold!r}:  # Library start-up is measured by bench_import.py, not here
+    import geopandas, pyproj, shapely
+stats = gridstats.GridStats(trace_memory={trace!r})
+start = time.perf_counter()
+pocketgrid.grid({in_path!r}, {out_path!r}, {in_epsg!r}, {out_epsg!r}, {spacing!r}, stats=stats)
+elapsed = time.perf_counter() - start
+traced = max([stage.peak_memory or 0 for stage in stats.stages.values()]) if {trace!r} else None
+print(json.dumps({{'seconds': elapsed, 'nodes': stats.nodes, 'bytes': gridstats.output_bytes({out_path!r}),
+                  'peak_rss': gridstats.peak_rss(), 'peak_traced': traced,
+                  'stages': {{stage.name: stage.seconds for stage in stats.stages.values()}}}}))
+"""
+
+
+def case_id(nodes, spacing, in_epsg, out_epsg, fmt):
+    return f"{nodes:.0e}-{spacing:g}m-{in_epsg}-{out_epsg}-{fmt}"
+
+
+def cases(max_nodes=1e6, formats=FORMATS):
+    # (nodes, spacing, in_epsg, out_epsg, format) of every case, in a fixed order
+    found = [(nodes, SPACINGS[0], *EPSG_PAIRS[0], fmt) for nodes in SIZES if nodes <= max_nodes for fmt in formats]
+    sweep = [(SWEEP_NODES, spacing, in_epsg, out_epsg, fmt) for spacing in SPACINGS for in_epsg, out_epsg in EPSG_PAIRS
+             for fmt in formats if fmt in ('csv', 'npy')]
+    return found + [case for case in sweep if case not in found and case[0] <= max_nodes]
+
+
+def bounding_box(nodes, spacing, in_epsg, out_epsg):
+    # GeoJSON FeatureCollection of a square around CENTER whose grid has about `nodes` nodes
+    import projcache
+    forward = projcache.get_transformer(in_epsg, out_epsg)
+    inverse = projcache.get_transformer(out_epsg, in_epsg)
+    x, y = forward.transform(*CENTER)
+    half = (math.sqrt(nodes) - 1) * spacing / 2
+    west, south = inverse.transform(x - half, y - half)
+    east, north = inverse.transform(x + half, y + half)
+    ring = [[west, south], [east, south], [east, north], [west, north], [west, south]]
+    return {'type': 'FeatureCollection',
+            'features': [{'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Polygon', 'coordinates': [ring]}}]}
+
+
+def run_case(case, folder, repeat=3, trace=False, cold=False):
+    nodes, spacing, in_epsg, out_epsg, fmt = case
+    in_path = os.path.join(folder, f"bbox_{nodes:.0e}_{spacing:g}_{in_epsg}_{out_epsg}.geojson")
+    if not os.path.exists(in_path):
+        with open(in_path, 'w') as of:
+            json.dump(bounding_box(nodes, spacing, in_epsg, out_epsg), of)
+    out_path = os.path.join(folder, 'grid' + EXTENSIONS[fmt])
+    probe = PROBE.format(repo=REPO, trace=trace, cold=cold, in_path=in_path, out_path=out_path, in_epsg=in_epsg,
+                         out_epsg=out_epsg, spacing=spacing)
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', probe], cwd=folder, capture_output=True, text=True)
+        if out.returncode != 0:
+            return {'case': case_id(*case), 'error': out.stderr.strip().splitlines()[-1]}
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        for path in (out_path, out_path + '.json'):
+            if os.path.exists(path):
+                os.remove(path)
+    best = min(runs, key=lambda run: run['seconds'])
+    median = sorted(run['seconds'] for run in runs)[len(runs) // 2]
+    return {'case': case_id(*case), 'nodes': best['nodes'], 'spacing': spacing, 'in_epsg': in_epsg,
+            'out_epsg': out_epsg, 'format': fmt, 'seconds': best['seconds'], 'median_seconds': median,
+            'rows_per_sec': best['nodes'] / best['seconds'] if best['seconds'] > 0 else None,
+            'peak_rss': max([run['peak_rss'] or 0 for run in runs]) or None,
+            'peak_traced': best['peak_traced'], 'bytes': best['bytes'], 'stages': best['stages']}
+
+
+def environment():
+    import numpy as np
+    import pyproj
+    commit = subprocess.run(['git', '-C', REPO, 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True)
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'pyproj': pyproj.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count(), 'commit': commit.stdout.strip() or None}
+
+
+def compare(results, baseline, time_threshold=0.1, memory_threshold=0.2, min_delta_ms=5.0):
+    # Regression messages for cases slower, larger in memory or larger on disk than the baseline allows
+    earlier = {result['case']: result for result in baseline.get('results', []) if 'error' not in result}
+    regressions = []
+    for result in results:
+        old = earlier.get(result['case'])
+        if old is None or 'error' in result:
+            continue
+        slower = result['seconds'] - old['seconds']
+        if slower > time_threshold * old['seconds'] and slower * 1000 > min_delta_ms:
+            regressions.append(f"{result['case']}: {old['seconds']:.3f} s -> {result['seconds']:.3f} s")
+        for key in ('peak_rss', 'peak_traced'):
+            if result.get(key) and old.get(key) and result[key] > (1 + memory_threshold) * old[key]:
+                regressions.append(f"{result['case']}: {key} {old[key] / 1e6:.1f} MB -> {result[key] / 1e6:.1f} MB")
+        if result['bytes'] > old['bytes']:
+            regressions.append(f"{result['case']}: output {old['bytes']:,} B -> {result['bytes']:,} B")
+    return regressions
+
+
+def format_result(result, old=None):
+    if 'error' in result:
+        return f"{result['case']:<34}  {result['error']}"
+    peak = '-' if result['peak_rss'] is None else f"{result['peak_rss'] / 1e6:.0f}"
+    line = (f"{result['case']:<34}{result['nodes']:>13,}{result['seconds']:>10.3f}{result['rows_per_sec']:>15,.0f}"
+            f"{peak:>10}{result['bytes'] / 1e6:>11.2f}")
+    if old is not None and 'error' not in old:
+        line += f"{100 * (result['seconds'] / old['seconds'] - 1):>+9.1f}%"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark grid generation and output on synthetic inputs")
+    parser.add_argument('--max-nodes', type=float, default=1e6, help="largest node count of the sweep (up to 1e8)")
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=FORMATS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tracemalloc', action='store_true', help="also measure the tracemalloc peak (slower)")
+    parser.add_argument('--cold', action='store_true', help="include importing geopandas, pyproj and shapely")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--baseline', help="results file to compare with")
+    parser.add_argument('--time-threshold', type=float, default=0.1, help="allowed relative slowdown")
+    parser.add_argument('--memory-threshold', type=float, default=0.2, help="allowed relative peak memory growth")
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    earlier = {result['case']: result for result in baseline.get('results', [])}
+    print(f"{'case':<34}{'nodes':>13}{'seconds':>10}{'rows/s':>15}{'peak MB':>10}{'out MB':>11}"
+          f"{'  vs base' if baseline else ''}")
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for case in cases(args.max_nodes, args.formats):
+            result = run_case(case, folder, args.repeat, args.tracemalloc, args.cold)
+            results.append(result)
+            print(format_result(result, earlier.get(result['case'])), flush=True)
+    if args.json:
+        with open(args.json, 'w') as of:
+            json.dump({'environment': environment(), 'results': results}, of, indent=2)
+    failed = any('error' in result for result in results)
+    if baseline:
+        regressions = compare(results, baseline, args.time_threshold, args.memory_threshold, args.min_delta_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+NAME:           bench_import.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Measures the cold import time of the grid modules in fresh interpreters and checks that importing them
+has no side effects: no heavy library (geopandas, folium, pyproj, shapely) is loaded and no file is written.
+Exits non-zero when a module loads a heavy library or exceeds the time budget, so it can gate short-lived batch
+containers.
+
+TO RUN:
+    -   python benchmarks/bench_import.py [--repeat 5] [--budget-ms 500] [--json results.json]
+
+DATA FORMAT:    Command line arguments
+
+REQUIRES:       argparse, json, os, subprocess, sys, tempfile
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['pocketgrid', 'mapper', 'gridinit', 'gridinit_basic', 'batchgrid', 'gridwriters', 'lazygrid', 'polyclip',
+           'projcache', 'gridcli', 'griddaemon', 'reproject', 'tiling', 'gridcache',
+           'gridlocate', 'pyramid', 'quadtree', 'gridpreview', 'gridstats', 'gridinput']
+HEAVY = ['geopandas', 'folium', 'pyproj', 'shapely']
+
+# Runs in a fresh interpreter: time the import and report which heavy modules it pulled in
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {repo!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module, repeat=5):
+    times, heavy = [], set()
+    with tempfile.TemporaryDirectory() as cwd:  # Any file written on import would show up here
+        for _ in range(repeat):
+            probe = PROBE.format(repo=REPO, module=module, heavy=HEAVY)
+            out = subprocess.run([sys.executable, '-c', probe], cwd=cwd, capture_output=True, text=True)
+            if out.returncode != 0:  # Importing raised, e.g. because it tried to read an input at import time
+                return {'module': module, 'best_ms': float('nan'), 'median_ms': float('nan'), 'heavy': [],
+                        'files_written': os.listdir(cwd), 'error': out.stderr.strip().splitlines()[-1]}
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            times.append(result['seconds'])
+            heavy.update(result['heavy'])
+        written = os.listdir(cwd)
+    return {'module': module, 'best_ms': min(times) * 1000, 'median_ms': sorted(times)[len(times) // 2] * 1000,
+            'heavy': sorted(heavy), 'files_written': written}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold import time and side-effect check for the grid modules")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=500.0, help="fail when a median import is slower")
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    args = parser.parse_args(argv)
+
+    results = [measure(module, args.repeat) for module in args.modules]
+    failed = False
+    print(f"{'module':<16}{'best ms':>10}{'median ms':>12}  heavy imports / files written")
+    for r in results:
+        bad = 'error' in r or r['heavy'] or r['files_written'] or r['median_ms'] > args.budget_ms
+        failed = failed or bool(bad)
+        print(f"{r['module']:<16}{r['best_ms']:>10.1f}{r['median_ms']:>12.1f}  "
+              f"{', '.join(r['heavy'] + r['files_written'] + [r.get('error', '')]).strip(', ') or '-'}"
+              f"{'  FAIL' if bad else ''}")
+    if args.json:
+        with open(args.json, 'w') as of:
+            json.dump(results, of, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,10 @@
 import os
+import sys
+import atexit
+import time
+import weakref
 import datetime
+from collections import deque
 from dataclasses import dataclass
 import colorama
 from enum import Enum
@@ -26,10 +31,10 @@ class ColoredLog:
     __reset: str = colorama.Fore.RESET + colorama.Back.RESET + colorama.Style.RESET_ALL  # '\x1b[0m'
 
     def __init__(self, type: ELogTypes, message: str, severe: bool, showTime: bool, timeFormat: str,
-                 textColor: colorama.Fore, bgColor: colorama.Back):
+                 textColor: colorama.Fore, bgColor: colorama.Back, timestamp: datetime.datetime = None):
         self.type = type
         self.message = message
-        self.timestamp = datetime.datetime.now()
+        self.timestamp = datetime.datetime.now() if (timestamp == None) else timestamp
         self.severe = severe
         self.showTime = showTime
         self.timeFormat = timeFormat
@@ -46,6 +51,64 @@ class ColoredLog:
         return f"{self.style}{self.textColor}{self.bgColor}{_timestamp}{msg}{self.__reset}"
 
 
+class LogRecord:
+    """ Compact history entry; the line is only formatted (colours, timestamp) when it is displayed """
+    __slots__ = ('type', 'message', 'severe', 'showTime', 'created')
+
+    def __init__(self, type: ELogTypes, message: str, severe: bool, showTime: bool):
+        self.type = type
+        self.message = message
+        self.severe = severe
+        self.showTime = showTime
+        self.created = time.time()
+
+    def format(self, timeFormat: str, color: bool = True):
+        timestamp = datetime.datetime.fromtimestamp(self.created)
+        if (not color):
+            return f"[{timestamp.strftime(timeFormat)}] {self.message}" if (self.showTime) else self.message
+        return str(ColoredLog(type=self.type, message=self.message, severe=self.severe, showTime=self.showTime,
+                              timeFormat=timeFormat, textColor=getDefaultTextColor(self.type, self.severe),
+                              bgColor=getDefaultBgColor(self.type, self.severe), timestamp=timestamp))
+
+
+class ConsoleSink:
+    """ Collects formatted lines and writes them to the stream in batches of bufferSize (0 writes every line) """
+
+    def __init__(self, stream=None, bufferSize: int = 0):
+        self.stream = stream
+        self.bufferSize = bufferSize
+        self.__lines = []
+
+    def write(self, line: str, flush: bool = False):
+        self.__lines.append(line)
+        if (flush or len(self.__lines) >= self.bufferSize):
+            self.flush()
+
+    def flush(self):
+        if (self.__lines):
+            stream = self.stream or sys.stdout  # Looked up late so colorama's wrapped stdout is used
+            stream.write("\n".join(self.__lines) + "\n")
+            stream.flush()
+            self.__lines.clear()
+
+    def __del__(self):
+        """ A console dropped with lines still buffered writes them out """
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+
+sinks = weakref.WeakSet()  # Every live sink; held weakly so consoles are not kept alive until exit
+
+
+@atexit.register
+def flushSinks():
+    """ Writes out whatever the sinks still alive at exit have buffered """
+    for sink in list(sinks):
+        sink.flush()
+
+
 def getDefaultTextColor(logType: ELogTypes, isSevere: bool):
     if (logType == ELogTypes.log):
         return colorama.Fore.WHITE if (isSevere) else ''
@@ -77,15 +140,45 @@ class ConsoleSettings:
     showTime: bool = True
     keepHistory: bool = False
     timeFormat: str = '%H:%M:%S'
+    historySize: int = 1000  # Records kept for showHistory; the oldest are dropped first
+    bufferSize: int = 0  # Lines collected before they are written; 0 writes every line at once
+    color: bool = None  # None: colour escapes only when stdout is a terminal
 
 
 class Console:
     __reset: str = colorama.Fore.RESET + colorama.Back.RESET + colorama.Style.RESET_ALL  # '\x1b[0m'
-    __logDict: {int: ColoredLog} = {}
-    settings = ConsoleSettings()
-
-    def __init__(self):
-        colorama.init(autoreset=False)
+    __coloramaReady: bool = False
+
+    def __init__(self, settings: ConsoleSettings = None, stream=None):
+        self.settings = ConsoleSettings() if (settings == None) else settings
+        self.__history = deque(maxlen=self.settings.historySize)
+        self.__sink = ConsoleSink(stream, self.settings.bufferSize)
+        self.__stream = stream
+        self.__progressWidth = 0  # Length of the progress line currently shown, 0 if none
+        sinks.add(self.__sink)
+
+    def isTerminal(self):
+        stream = self.__stream or sys.stdout
+        return hasattr(stream, 'isatty') and stream.isatty()
+
+    @property
+    def color(self):
+        return self.isTerminal() if (self.settings.color == None) else self.settings.color
+
+    def __print(self, cr, flush: bool = False):
+        """ colorama wraps stdout, so it is only initialised once something is actually printed in colour """
+        color = self.color
+        if (color and not Console.__coloramaReady):
+            colorama.init(autoreset=False, strip=False if (self.settings.color) else None)  # Forced: keep
+            Console.__coloramaReady = True
+        line = cr.format(self.settings.timeFormat, color) if (isinstance(cr, LogRecord)) else str(cr)
+        if (self.__progressWidth):  # Start below an unfinished progress line
+            line = "\n" + line
+            self.__progressWidth = 0
+        self.__sink.write(line, flush)
+
+    def flush(self):
+        self.__sink.flush()
 
     # region Settings
     def setShowTimeDefault(self, doShowTime: bool):
@@ -94,11 +187,25 @@ class Console:
     def setTimeFormat(self, timeFormat: str):
         self.settings.timeFormat = timeFormat
 
+    def setHistorySize(self, historySize: int):
+        self.settings.historySize = historySize
+        self.__history = deque(self.__history, maxlen=historySize)
+
+    def setBufferSize(self, bufferSize: int):
+        self.flush()
+        self.settings.bufferSize = bufferSize
+        self.__sink.bufferSize = bufferSize
+
+    def setColor(self, color: bool):
+        """ True/False forces colour escapes on or off, None detects a terminal """
+        self.settings.color = color
+
     # endregion
 
     # region Console Functions
     def clearScreen(self):
         """ PyCharm: tick box in run options: 'Emulate terminal in output console' to True """
+        self.flush()
         _ = os.system('cls||clear')
         print("", end="\r")
         pass
@@ -107,40 +214,34 @@ class Console:
 
     # region Printing lines
     def log(self, *message: str, severe: bool = False, showTime: bool = None):
-        message = " ".join([str(m) for m in message])
-        cr = self.__create_line(logType=ELogTypes.log, message=f'{message}', severe=severe, showTime=showTime)
-        print(cr)
+        cr = self.__create_line(logType=ELogTypes.log, message=message, severe=severe, showTime=showTime)
+        self.__print(cr, flush=severe)
 
     def warn(self, *message: str, severe: bool = False, showTime: bool = None):
-        message = " ".join([str(m) for m in message])
-        cr = self.__create_line(logType=ELogTypes.warn, message=f'{message}', severe=severe, showTime=showTime)
-        print(cr)
+        cr = self.__create_line(logType=ELogTypes.warn, message=message, severe=severe, showTime=showTime)
+        self.__print(cr, flush=severe)
 
     def error(self, *message: str, severe: bool = False, showTime: bool = None):
-        message = " ".join([str(m) for m in message])
-        cr = self.__create_line(logType=ELogTypes.error, message=f'{message}', severe=severe, showTime=showTime)
-        print(cr)
+        cr = self.__create_line(logType=ELogTypes.error, message=message, severe=severe, showTime=showTime)
+        self.__print(cr, flush=True)
 
     def success(self, *message: str, severe: bool = False, showTime: bool = None):
-        message = " ".join([str(m) for m in message])
-        cr = self.__create_line(logType=ELogTypes.success, message=f'{message}', severe=severe, showTime=showTime)
-        print(cr)
+        cr = self.__create_line(logType=ELogTypes.success, message=message, severe=severe, showTime=showTime)
+        self.__print(cr, flush=severe)
 
     def info(self, *message: str, severe: bool = False, showTime: bool = None):
-        message = " ".join([str(m) for m in message])
-        cr = self.__create_line(logType=ELogTypes.info, message=f'{message}', severe=severe, showTime=showTime)
-        print(cr)
+        cr = self.__create_line(logType=ELogTypes.info, message=message, severe=severe, showTime=showTime)
+        self.__print(cr, flush=severe)
 
-    def __create_line(self, logType: ELogTypes, message: str, severe: bool, showTime: bool):
-        cr = self.__createConsoleRecord(
+    def __create_line(self, logType: ELogTypes, message: tuple, severe: bool, showTime: bool):
+        cr = LogRecord(
             type=logType,
-            message=message, severe=severe,
-            showTime=showTime,
-            textColor=getDefaultTextColor(logType=logType, isSevere=severe),
-            bgColor=getDefaultBgColor(logType=logType, isSevere=severe)
+            message=str(message[0]) if (len(message) == 1) else " ".join([str(m) for m in message]),
+            severe=severe,
+            showTime=self.settings.showTime if (showTime == None) else showTime
         )
         if (self.settings.keepHistory):
-            self.__logDict[id(cr)] = cr
+            self.__history.append(cr)
         return cr
 
     # endregion
@@ -157,7 +258,22 @@ class Console:
             bgColor=bgColor
         )
 
+    def progress(self, *message: str, done: bool = False):
+        """ Rewrites a single status line in place on a terminal; elsewhere only the final (done) line is written """
+        line = str(message[0]) if (len(message) == 1) else " ".join([str(m) for m in message])
+        if (not self.isTerminal()):
+            if (done):
+                self.__sink.write(line, flush=True)
+            return
+        self.flush()
+        stream = self.__stream or sys.stdout
+        stream.write("\r" + line.ljust(self.__progressWidth) + ("\n" if (done) else ""))
+        stream.flush()
+        self.__progressWidth = 0 if (done) else len(line)
+
     def highlight(self, message: str, bgColor: str = colorama.Back.YELLOW, textColor: str = colorama.Fore.BLACK):
+        if (not self.color):
+            return message
         cr = self.__createConsoleRecord(
             type=ELogTypes.info.value,
             message=message, severe=False,
@@ -166,9 +282,14 @@ class Console:
         )
         return cr.__str__()
 
+    def history(self):
+        """ Kept records, oldest first """
+        return list(self.__history)
+
     def showHistory(self):
-        for _id, cr in self.__logDict.items():
-            print(cr)
+        for cr in self.__history:
+            self.__print(cr)
+        self.flush()
 
     def refresh_console(self):
         """ Clears screen and prints history anew """
@@ -0,0 +1,167 @@
+"""
+NAME:           gridcache.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Content-addressed on-disk cache of generated grids. Entries are keyed by a SHA-256 hash of the input
+geometry (WKB) and every parameter that changes the nodes (EPSG pair, spacing, clipping, extra coordinate columns),
+so regenerating a grid that was already built is a memory-mapped load instead of a read, transform, generate and
+write. Entries are float64 .npy files with a .json metadata sidecar; hits refresh an entry's modification time and
+the least recently used entries are deleted whenever the cache grows past its disk budget. A grid larger than the
+whole budget is returned from its entry and the entry is deleted straight away, so it never pushes the other entries
+out. Hit, miss and eviction counts are kept per cache object for sizing the budget.
+
+TO RUN:
+    -   Call pocketgrid.grid(..., cache=True) to use the default cache (CACHE_DIR, CACHE_BYTES) or pass a GridCache:
+          -  GridCache(cache_dir, max_bytes) - get(key), put(key, blocks, meta), stats(), clear()
+          -  stats() - counters and disk usage of the default cache
+
+DATA FORMAT:    <cache_dir>/<key>.npy (n, k) float64 grid and <cache_dir>/<key>.json gridwriters metadata
+
+REQUIRES:       hashlib, json, os, threading, pathlib, numpy, gridwriters, shapely (for key)
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+import numpy as np
+import gridwriters
+
+CACHE_DIR = os.path.join(Path.home(), ".gridcache", "grids")  # mapper.py keeps its layers in .gridcache/mapper
+CACHE_BYTES = 2 << 30  # Disk budget of the default cache (2 GiB)
+CACHE_VERSION = 1  # Bump when the node layout changes so old entries are never served
+
+
+def key(geometry, **params):
+    # Hex digest of the geometry's WKB plus the parameters, independent of the input file's name and format
+    import shapely
+    digest = hashlib.sha256(shapely.to_wkb(geometry, byte_order=1))
+    digest.update(json.dumps(dict(params, version=CACHE_VERSION), sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class GridCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_BYTES):
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _paths(self, name):
+        base = os.path.join(self.cache_dir, name)
+        return base + '.npy', base + '.json'
+
+    def get(self, name):
+        # (read-only memmap, meta) for a cached grid, or None on a miss
+        grid_path, meta_path = self._paths(name)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            grid_memmap = np.load(grid_path, mmap_mode='r')
+            os.utime(grid_path)  # Most recently used
+        except (OSError, ValueError):  # Missing, evicted meanwhile or half written by a crashed process
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return grid_memmap, meta
+
+    def put(self, name, blocks, meta):
+        # Streams the blocks into a new entry, evicts down to the budget and returns (read-only memmap, meta); an entry
+        # over the whole budget is not kept
+        grid_path, meta_path = self._paths(name)
+        part = f"{grid_path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            gridwriters.write_npy(part, blocks, meta, dtype=np.float64)
+            with open(meta_path, 'w') as of:
+                json.dump(meta, of)
+            os.replace(part, grid_path)  # Readers only ever see complete entries
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+        grid_memmap = np.load(grid_path, mmap_mode='r')
+        if os.path.getsize(grid_path) + os.path.getsize(meta_path) > self.max_bytes:
+            if self._remove(name):  # The memmap stays readable (POSIX); Windows keeps it until a later eviction
+                with self._lock:
+                    self.evictions += 1
+        else:
+            self.evict(keep=name)
+        return grid_memmap, meta
+
+    def entries(self):
+        # (modification time, bytes, name) of every entry, least recently used first
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npy'):
+                name = entry.name[:-4]
+                size = entry.stat().st_size
+                meta_path = self._paths(name)[1]
+                if os.path.exists(meta_path):
+                    size += os.path.getsize(meta_path)
+                found.append((entry.stat().st_mtime, size, name))
+        return sorted(found)
+
+    def evict(self, keep=None):
+        # Deletes least recently used entries until the cache fits max_bytes
+        found = self.entries()
+        total = sum(size for _, size, _ in found)
+        for _, size, name in found:
+            if total <= self.max_bytes:
+                break
+            if name == keep or not self._remove(name):
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def _remove(self, name):
+        # Deletes an entry; False if it is still memory-mapped elsewhere (Windows) or was removed by another process
+        try:
+            for path in self._paths(name):
+                os.remove(path)
+        except OSError:
+            return False
+        return True
+
+    def stats(self):
+        found = self.entries()
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(found),
+                    'bytes': sum(size for _, size, _ in found), 'max_bytes': self.max_bytes}
+
+    def clear(self):
+        for _, _, name in self.entries():
+            for path in self._paths(name):
+                if os.path.exists(path):
+                    os.remove(path)
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+
+_default_cache = None
+
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:  # Created on first use so importing this module never touches the disk
+        _default_cache = GridCache()
+    return _default_cache
+
+
+def stats():
+    return default_cache().stats()
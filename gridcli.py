@@ -0,0 +1,236 @@
+"""
+NAME:           gridcli.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Non-interactive entry point for the grid generator. Takes the same five parameters gridinit.py prompts
+for (plus the output options of pocketgrid.grid) as command line flags, or a JSON manifest listing many jobs, and
+runs the jobs concurrently on a process pool with no prompts, so it can be run unattended from a scheduler. Reports
+per-job wall time, node count and output size (plus the time of each stage in the JSON report, see gridstats.py), and
+exits non-zero if any job failed.
+
+TO RUN:
+    -   Single job:
+          -  python gridcli.py --in-path boundingbox.geojson --out-path grid.csv [--in-epsg 4326] [--out-epsg 26915]
+                [--grid-spacing 500] [--clip] [--format npy] [--precision 6] [--dtype float64] [--extra-epsg 4326]
+    -   Many jobs:
+          -  python gridcli.py --manifest jobs.json [--workers 4] [--json report.json]
+    -   --workers defaults to the number of CPUs; --workers 1 runs the jobs one after another in this process
+    -   --shard i/N (and/or --tile-size) writes fixed tiles plus an index file instead of one output (see tiling.py)
+
+DATA FORMAT:    The manifest is either a list of jobs or {"defaults": {...}, "workers": n, "jobs": [...]}. Each job is
+an object with the keys in_path (or geojson, an inline GeoJSON object) and out_path and optionally name, in_epsg,
+out_epsg, grid_spacing, clip, out_format, precision, dtype ("float32" or "float64"), extra_epsg, tile_size and shard
+("i/N"); missing keys come from "defaults", then from pocketgrid.grid's defaults. Relative paths are taken relative to
+the manifest file.
+    [
+        {"name": "coarse", "in_path": "boundingbox.geojson", "out_path": "coarse.csv", "grid_spacing": 1000},
+        {"in_path": "boundingbox.geojson", "out_path": "fine.npy", "grid_spacing": 100, "clip": true}
+    ]
+
+REQUIRES:       argparse, json, os, sys, tempfile, time, concurrent.futures, numpy, pocketgrid, gridwriters, gridstats,
+                tiling
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import gridstats
+import gridwriters
+import pocketgrid
+import tiling
+
+JOB_DEFAULTS = {'in_epsg': 4326, 'out_epsg': 26915, 'grid_spacing': 500, 'clip': False, 'out_format': None,
+                'precision': 6, 'dtype': 'float64', 'extra_epsg': None, 'tile_size': None, 'shard': None}
+JOB_KEYS = {'name', 'in_path', 'geojson', 'out_path'} | set(JOB_DEFAULTS)
+
+
+def make_job(entry, defaults=None, base_dir=None, number=0):
+    # Fills in the defaults and checks the keys of one job; relative paths are resolved against base_dir
+    job = {**JOB_DEFAULTS, **(defaults or {}), **entry}
+    unknown = set(job) - JOB_KEYS
+    if unknown:
+        raise ValueError(f"job {number}: unknown key(s) {', '.join(sorted(unknown))}")
+    if not job.get('in_path') and not job.get('geojson'):
+        raise ValueError(f"job {number}: in_path (or an inline geojson) is required")
+    if not job.get('out_path'):
+        raise ValueError(f"job {number}: out_path is required")
+    for key in ('in_path', 'out_path'):
+        if job.get(key) and base_dir is not None:
+            job[key] = os.path.join(base_dir, job[key])  # Absolute paths are left as they are
+    job['out_format'] = gridwriters.output_format(job['out_path'], job['out_format'])  # Fail before any job runs
+    job['dtype'] = np.dtype(job['dtype']).name
+    if job['shard'] is not None:
+        tiling.parse_shard(job['shard'])
+    job.setdefault('name', os.path.basename(job['out_path']))
+    return job
+
+
+def load_manifest(manifest_path):
+    # (jobs, workers) from a manifest file; workers is None unless the manifest sets it
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = [make_job(entry, manifest.get('defaults'), base_dir, n) for n, entry in enumerate(manifest['jobs'])]
+    return jobs, manifest.get('workers')
+
+
+def output_size(out_path):
+    # Bytes written for a job, including the .json sidecar of raw outputs
+    size = os.path.getsize(out_path)
+    if os.path.exists(gridwriters.sidecar_path(out_path)):
+        size += os.path.getsize(gridwriters.sidecar_path(out_path))
+    return size
+
+
+def _run_tiled(job, in_path):
+    # Tiled run of one shard: node count and bytes are summed over this shard's tiles and its index file
+    shard, shards = tiling.parse_shard(job['shard'] or '0/1')
+    index = pocketgrid.tile_grid(in_path, job['out_path'], job['in_epsg'], job['out_epsg'], job['grid_spacing'],
+                                 dtype=np.dtype(job['dtype']), precision=job['precision'],
+                                 out_format=job['out_format'], clip=job['clip'], extra_epsg=job['extra_epsg'],
+                                 tile_nodes=job['tile_size'] or tiling.TILE_NODES, shard=shard, shards=shards)
+    folder = os.path.dirname(os.path.abspath(job['out_path']))
+    index_file = tiling.index_path(job['out_path'], shard, shards)
+    size = sum(output_size(os.path.join(folder, entry['path'])) for entry in index['tiles'])
+    return {'out_path': index_file, 'nodes': sum(entry['count'] for entry in index['tiles']),
+            'bytes': size + os.path.getsize(index_file), 'tiles': len(index['tiles'])}
+
+
+def failed_result(job, error):
+    # Result record of a job that did not complete, for errors raised inside or outside run_job
+    return {'name': job['name'], 'out_path': job['out_path'], 'status': 'failed', 'nodes': 0, 'bytes': 0,
+            'error': f"{type(error).__name__}: {error}", 'seconds': 0.0}
+
+
+def run_job(job):
+    start = time.perf_counter()
+    result = {'name': job['name'], 'out_path': job['out_path']}
+    inline_path = None
+    try:
+        if job.get('geojson') is not None:  # Inline GeoJSON goes through a temporary file like any other input
+            with tempfile.NamedTemporaryFile('w', suffix='.geojson', delete=False) as f:
+                json.dump(job['geojson'], f)
+            inline_path = f.name
+        if job['tile_size'] or job['shard']:
+            result.update(_run_tiled(job, inline_path or job['in_path']), status='ok')
+        else:
+            stats = gridstats.GridStats()
+            source, _ = pocketgrid.write_grid(inline_path or job['in_path'], job['out_path'], job['in_epsg'],
+                                              job['out_epsg'], job['grid_spacing'], dtype=np.dtype(job['dtype']),
+                                              precision=job['precision'], out_format=job['out_format'],
+                                              clip=job['clip'], extra_epsg=job['extra_epsg'], stats=stats)
+            result.update(status='ok', nodes=len(source), bytes=output_size(job['out_path']),
+                          stages={stage.name: stage.seconds for stage in stats.stages.values()})
+    except Exception as e:  # One bad job is reported rather than stopping the rest of the run
+        result = failed_result(job, e)
+    finally:
+        if inline_path is not None:
+            os.remove(inline_path)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def run(jobs, workers=None, report=None):
+    # Runs the jobs on a process pool and returns their results in job order. report(result) is called as each job
+    # finishes.
+    results = [None] * len(jobs)
+    if workers == 1 or len(jobs) < 2:
+        for n, job in enumerate(jobs):
+            results[n] = run_job(job)
+            if report is not None:
+                report(results[n])
+        return results
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, job): n for n, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            n = futures[future]
+            try:
+                results[n] = future.result()
+            except Exception as e:  # A dead worker breaks the pool (BrokenProcessPool) and fails every unfinished job
+                results[n] = failed_result(jobs[n], e)
+            if report is not None:
+                report(results[n])
+    return results
+
+
+def format_result(result):
+    line = (f"{result['name']:<24} {result['status']:<7}{result['seconds']:>9.2f} s{result['nodes']:>14,} nodes"
+            f"{result['bytes'] / 1e6:>11.2f} MB  {result['out_path']}")
+    return line + (f"\n    {result['error']}" if 'error' in result else '')
+
+
+def add_job_arguments(parser):
+    # Flags shared by gridcli and the griddaemon client
+    parser.add_argument('--manifest', help="JSON file listing the jobs to run")
+    parser.add_argument('--in-path', help="input .geojson")
+    parser.add_argument('--out-path', help="output path; the extension selects the format")
+    parser.add_argument('--in-epsg', type=int, default=JOB_DEFAULTS['in_epsg'])
+    parser.add_argument('--out-epsg', type=int, default=JOB_DEFAULTS['out_epsg'])
+    parser.add_argument('--grid-spacing', type=int, default=JOB_DEFAULTS['grid_spacing'])
+    parser.add_argument('--clip', action='store_true', help="keep only the nodes inside the input polygon")
+    parser.add_argument('--format', dest='out_format', choices=sorted(gridwriters.WRITERS),
+                        help="output format overriding the out-path extension")
+    parser.add_argument('--precision', type=int, default=JOB_DEFAULTS['precision'])
+    parser.add_argument('--dtype', choices=['float32', 'float64'], default=JOB_DEFAULTS['dtype'])
+    parser.add_argument('--extra-epsg', type=int, help="append each node's coordinates in this CRS (4326: lon,lat)")
+    parser.add_argument('--tile-size', type=int, help="write fixed tiles of this many columns and rows plus an index")
+    parser.add_argument('--shard', help="write only shard i/N (0-based) of the tiles; merge with tiling.py merge")
+    parser.add_argument('--workers', type=int, help="worker processes, defaults to the number of CPUs")
+    parser.add_argument('--json', help="also write the per-job results to this file")
+
+
+def jobs_from_args(parser, args):
+    # (jobs, workers) from parsed add_job_arguments flags; exits with a usage error on a bad manifest or job
+    try:
+        if args.manifest:
+            jobs, workers = load_manifest(args.manifest)
+        elif args.in_path and args.out_path:
+            flags = {key: getattr(args, key) for key in JOB_KEYS - {'name', 'geojson'}}
+            jobs, workers = [make_job(flags, base_dir=os.getcwd())], None
+        else:
+            parser.error("give either --manifest or both --in-path and --out-path")
+    except (OSError, KeyError, ValueError, TypeError) as e:
+        parser.error(str(e))
+    return jobs, args.workers if args.workers is not None else workers
+
+
+def write_report(results, started, json_path=None):
+    # Summary line (and optional JSON report) after a run; returns the exit code
+    failed = sum(result['status'] != 'ok' for result in results)
+    print(f"{len(results) - failed} of {len(results)} jobs completed in {time.perf_counter() - started:.2f} s")
+    if json_path:
+        with open(json_path, 'w') as of:
+            json.dump(results, of, indent=2)
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate grids without prompts, from flags or a JSON manifest")
+    add_job_arguments(parser)
+    args = parser.parse_args(argv)
+    jobs, workers = jobs_from_args(parser, args)
+
+    start = time.perf_counter()
+    results = run(jobs, workers, report=lambda result: print(format_result(result), flush=True))
+    return write_report(results, start, args.json)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
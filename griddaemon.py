@@ -0,0 +1,218 @@
+"""
+NAME:           griddaemon.py
+
+COMPATIBILITY:  Python 3.10 (needs Unix domain sockets, i.e. Linux or macOS)
+
+DESCRIPTION:    Long-lived grid server. Keeps a pool of worker processes that have already imported geopandas, pyproj
+and shapely and built the default transformer, and accepts grid jobs over a local Unix socket, so small grids no
+longer pay the one to two second library start-up of a fresh interpreter. Concurrent requests share the warm pool;
+each job's result is streamed back to its client as soon as that job finishes. A thin client submits jobs from the
+command line with the same flags and manifests as gridcli.py.
+
+TO RUN:
+    -   Start the server (runs until interrupted or sent a shutdown request):
+          -  python griddaemon.py serve [--socket /tmp/griddaemon.sock] [--workers 4]
+    -   Submit jobs from another shell; paths are resolved on the client side before they are sent:
+          -  python griddaemon.py submit --in-path boundingbox.geojson --out-path grid.csv [--grid-spacing 250] ...
+          -  python griddaemon.py submit --manifest jobs.json [--json report.json]
+          -  python griddaemon.py ping / python griddaemon.py shutdown
+    -   From Python, submit(jobs) yields the job results as they arrive
+
+DATA FORMAT:    Newline-delimited JSON. A request is {"jobs": [job, ...]} with jobs as in gridcli.py manifests (in_path
+or an inline "geojson" object), {"op": "ping"} or {"op": "shutdown"}. The server answers a job request with one line
+per job, the gridcli result plus its "index" in the request, as each finishes, then {"done": true}. A job whose
+worker dies gets a failed result like any other failing job, and the server replaces the broken pool.
+
+REQUIRES:       argparse, json, os, socket, socketserver, sys, tempfile, threading, time, concurrent.futures, gridcli,
+                pocketgrid, projcache (geopandas, pyproj, shapely in the workers)
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import gridcli
+
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), "griddaemon.sock")
+WARM_EPSG = [(4326, 26915)]  # Transformers built in every worker before the first request
+
+
+def _warm(epsg_pairs):
+    # Worker initializer: pay the library imports and PROJ lookups once per worker rather than once per job
+    import geopandas  # noqa: F401
+    import shapely  # noqa: F401
+    import projcache
+    for in_epsg, out_epsg in epsg_pairs:
+        projcache.get_transformer(in_epsg, out_epsg)
+
+
+def _ready(_):
+    return os.getpid()
+
+
+class GridHandler(socketserver.StreamRequestHandler):
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode())
+        self.wfile.flush()
+
+    def handle(self):
+        for line in self.rfile:  # A client may send several requests over one connection
+            try:
+                request = json.loads(line)
+                if request.get('op') == 'ping':
+                    self.send({'ok': True, 'workers': self.server.workers, 'pid': os.getpid()})
+                elif request.get('op') == 'shutdown':
+                    self.send({'ok': True})
+                    threading.Thread(target=self.server.shutdown).start()
+                    return
+                else:
+                    self.run_jobs([gridcli.make_job(job, number=n) for n, job in enumerate(request['jobs'])])
+            except (KeyError, TypeError, ValueError) as e:  # Bad request: report it and keep the connection
+                self.send({'done': True, 'error': f"{type(e).__name__}: {e}"})
+            except ConnectionError:  # Client went away; jobs already submitted still finish
+                return
+
+    def run_jobs(self, jobs):
+        # Every job gets a result line, a failure record if its worker raised or died
+        futures = {self.server.submit(gridcli.run_job, job): n for n, job in enumerate(jobs)}
+        broken = False
+        for future in as_completed(futures):
+            n = futures[future]
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:  # A worker died (killed, out of memory) and took the pool's jobs with it
+                broken = True
+                result = gridcli.failed_result(jobs[n], e)
+            except Exception as e:
+                result = gridcli.failed_result(jobs[n], e)
+            self.send({'index': n, **result})
+        if broken:
+            self.server.replace_pool()
+        self.send({'done': True})
+
+
+class GridServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path=SOCKET_PATH, workers=None, warm_epsg=WARM_EPSG):
+        if os.path.exists(socket_path):  # Left behind by a server that did not shut down cleanly
+            os.remove(socket_path)
+        super().__init__(socket_path, GridHandler)
+        self.workers = workers or os.cpu_count() or 1
+        self.warm_epsg = warm_epsg
+        self.pool_lock = threading.Lock()
+        self.pool = None
+        try:
+            self.pool = self._new_pool()
+        except BaseException:
+            self.server_close()
+            raise
+
+    def _new_pool(self):
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm, initargs=(self.warm_epsg,))
+        try:
+            list(pool.map(_ready, range(self.workers)))  # Start (and warm) the workers before the first request
+        except BaseException:
+            pool.shutdown()
+            raise
+        return pool
+
+    def replace_pool(self):
+        # A broken pool refuses new work; the first handler to notice starts a fresh warm one. Returns the pool.
+        with self.pool_lock:
+            try:
+                self.pool.submit(_ready, 0)
+            except BrokenProcessPool:
+                self.pool.shutdown(wait=False)
+                self.pool = self._new_pool()
+        return self.pool
+
+    def submit(self, fn, *args):
+        pool = self.pool
+        try:
+            return pool.submit(fn, *args)
+        except BrokenProcessPool:  # Broken by another request whose worker died; retry once on the new pool
+            return self.replace_pool().submit(fn, *args)
+
+    def server_close(self):
+        super().server_close()
+        if self.pool is not None:
+            self.pool.shutdown()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def serve(socket_path=SOCKET_PATH, workers=None, warm_epsg=WARM_EPSG):
+    with GridServer(socket_path, workers, warm_epsg) as server:
+        print(f"griddaemon listening on {socket_path} with {server.workers} warm workers", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def request(message, socket_path=SOCKET_PATH):
+    # Sends one request and yields the server's reply lines up to and including the last one
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(message) + "\n").encode())
+        with sock.makefile('r') as replies:
+            for line in replies:
+                reply = json.loads(line)
+                last = 'index' not in reply
+                yield reply
+                if last:
+                    return
+
+
+def submit(jobs, socket_path=SOCKET_PATH):
+    # Yields the result of each job as the server finishes it; paths should be absolute (the server's working
+    # directory is not the client's)
+    for reply in request({'jobs': jobs}, socket_path):
+        if 'error' in reply and 'index' not in reply:
+            raise ValueError(reply['error'])
+        if 'index' in reply:
+            yield reply
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm grid worker server and its client")
+    parser.add_argument('command', choices=['serve', 'submit', 'ping', 'shutdown'])
+    parser.add_argument('--socket', default=SOCKET_PATH)
+    gridcli.add_job_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        serve(args.socket, args.workers)
+        return 0
+    if args.command in ('ping', 'shutdown'):
+        for reply in request({'op': args.command}, args.socket):
+            print(reply)
+        return 0
+    jobs, _ = gridcli.jobs_from_args(parser, args)  # The server's pool size applies, not --workers
+    start = time.perf_counter()
+    results = [None] * len(jobs)
+    for result in submit(jobs, args.socket):
+        results[result.pop('index')] = result
+        print(gridcli.format_result(result), flush=True)
+    return gridcli.write_report(results, start, args.json)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
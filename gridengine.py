@@ -0,0 +1,95 @@
+"""
+NAME:           gridengine.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Array engine behind pocketgrid.grid. Node coordinates of the regularly spaced lattice are computed
+directly from the easting and northing axis vectors by broadcasting, so no per-node Python objects are created.
+iter_blocks streams the same lattice as fixed-size column or row blocks so memory stays bounded on any domain.
+
+TO RUN:
+    -   Imported by pocketgrid.py. Not intended to be run on its own.
+
+DATA FORMAT:    SW and NE corners as (x, y) tuples in the projected coordinate system, grid spacing in CRS units
+
+REQUIRES:       numpy, shapely (only for to_points)
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import numpy as np
+
+
+def axis_count(start, stop, spacing):
+    # Number of nodes start + k * spacing that fall strictly below stop (matches the while loop in pocketgrid)
+    if stop <= start:
+        return 0
+    count = int(np.ceil((stop - start) / spacing))
+    while count > 0 and start + (count - 1) * spacing >= stop:
+        count -= 1
+    while start + count * spacing < stop:
+        count += 1
+    return count
+
+
+def axis(start, stop, spacing, dtype=np.float64):
+    count = axis_count(start, stop, spacing)
+    return (start + np.arange(count, dtype=np.float64) * spacing).astype(dtype, copy=False)
+
+
+def shape(sw, ne, spacing):
+    # Returns (columns, rows) of the lattice, i.e. number of eastings and northings
+    return axis_count(sw[0], ne[0], spacing), axis_count(sw[1], ne[1], spacing)
+
+
+def _fill(out, outer, inner, order):
+    view = out.reshape(outer.size, inner.size, 2)
+    if order == 'column':  # Column-major order: northings vary fastest within each easting
+        view[:, :, 0] = outer[:, None]
+        view[:, :, 1] = inner[None, :]
+    else:  # Row-major order: eastings vary fastest within each northing
+        view[:, :, 0] = inner[None, :]
+        view[:, :, 1] = outer[:, None]
+    return out
+
+
+def _axes(sw, ne, spacing, order):
+    xs = axis(sw[0], ne[0], spacing)
+    ys = axis(sw[1], ne[1], spacing)
+    if order == 'column':
+        return xs, ys
+    if order == 'row':
+        return ys, xs
+    raise ValueError(f"order must be 'column' or 'row', not {order!r}")
+
+
+def lattice(sw, ne, spacing, dtype=np.float64, order='column'):
+    outer, inner = _axes(sw, ne, spacing, order)
+    return _fill(np.empty((outer.size * inner.size, 2), dtype=dtype), outer, inner, order)
+
+
+def lattice_from_axes(xs, ys, dtype=np.float64, order='column'):
+    outer, inner = (xs, ys) if order == 'column' else (ys, xs)
+    return _fill(np.empty((xs.size * ys.size, 2), dtype=dtype), outer, inner, order)
+
+
+def iter_blocks(sw, ne, spacing, block_size=256, dtype=np.float64, order='column'):
+    # Yields block_size columns (or rows) of the lattice at a time; only the axis vectors are ever held in full
+    if block_size < 1:
+        raise ValueError("block_size must be a positive integer")
+    outer, inner = _axes(sw, ne, spacing, order)
+    for start in range(0, outer.size, block_size):
+        chunk = outer[start:start + block_size]
+        yield _fill(np.empty((chunk.size * inner.size, 2), dtype=dtype), chunk, inner, order)
+
+
+def to_points(coords):
+    import shapely  # Shapely objects are only built when explicitly requested
+    return shapely.points(np.asarray(coords, dtype=np.float64))
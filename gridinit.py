@@ -12,7 +12,7 @@ TO RUN:
 
 DATA FORMAT:    Manual input
 
-REQUIRES:       os, pathlib,
+REQUIRES:       os, time, pathlib, gridstats,
                 console (datetime, dataclasses, colorama, enum),
                 mapper (folium, geopandas, webbrowser),
                 pocketgrid (pyproj, shapely, numpy)
@@ -28,19 +28,41 @@ CONTACT:        hbienn@thewaterinstitute.org
 """
 
 import os
+import time
 from pathlib import Path
 from console import Console
+from gridstats import GridStats
 from mapper import mapper
 from pocketgrid import grid
 from colorama import Fore as textColor
 from colorama import Back as bgColor
 
-console = Console()
-console.setShowTimeDefault(False)
 n = "\n"
 
 
+def progress_line(console, interval=0.25):
+    # GridStats callback drawing the current stage, nodes/sec and ETA on one console line, at most every interval s
+    shown = [0.0]
+
+    def show(stats):
+        now = time.perf_counter()
+        if now - shown[0] < interval:
+            return
+        shown[0] = now
+        if not stats.total:
+            console.progress(f"{stats.current}...")
+            return
+        eta = "-" if stats.eta is None else f"{stats.eta:.0f} s"
+        console.progress(f"{stats.current}: {stats.done:,} / {stats.total:,} nodes "
+                         f"({100 * stats.done / stats.total:.0f}%)  {stats.rate:,.0f} nodes/s  ETA {eta}")
+
+    return show
+
+
 def run():
+    console = Console()
+    console.setShowTimeDefault(False)
+
     console.success(
         f"{n}"
         f"Welcome to the SmartPort Dynamic Grid Generator."
@@ -81,7 +103,8 @@ def run():
         f"{n}"
         f"  By default the function will save a "'grid.csv'" to your documents folder."
         f"{n}"
-        f"  This parameter will accept any *.csv or *.txt as input if it is provided as a properly formatted path."
+        f"  This parameter will accept any *.csv, *.txt, *.npy (memory-mapped), *.npz, *.f32/*.f64 (raw binary with a "
+        f"*.json sidecar) or *.parquet (GeoParquet) as input if it is provided as a properly formatted path."
         f"{n}"
         , severe=False
     )
@@ -128,8 +151,8 @@ def run():
           n, n,
           "2) out_path        By default the function will save a "'grid.csv'" to your documents folder",
           n,
-          "                   This parameter will accept any *.csv or *.txt if it is provided as a properly formatted "
-          "path.",
+          "                   This parameter will accept any *.csv, *.txt, *.npy, *.npz, *.f32, *.f64 or *.parquet if "
+          "it is provided as a properly formatted path.",
           n, n,
           "3) in_epsg         Default value is 4326, the EPSG id for WGS84 geographic coordinate system with units in "
           "degrees (https://epsg.io/4326).",
@@ -163,7 +186,8 @@ def run():
     def output_mod():
         output_mod = input("Would you like to specify a different output path than the default value? (Y/N)")
         if output_mod == "Y":
-            out_path = input("Enter the fully formatted path to your output .txt or .csv.")
+            out_path = input("Enter the fully formatted path to your output .txt, .csv, .npy, .npz, .f32, .f64 or "
+                             ".parquet.")
         else:
             out_path = str(os.path.join(Path.home(), "Documents") + "\\grid.csv")
         return out_path
@@ -227,12 +251,16 @@ def run():
 
     input("Press any key to run the grid generator with these values.")
 
-    grid_nparray = grid(in_path, out_path, in_epsg, out_epsg, grid_spacing)
+    stats = GridStats(callback=progress_line(console))
+    grid_nparray = grid(in_path, out_path, in_epsg, out_epsg, grid_spacing, stats=stats)
+    console.progress(f"{stats.nodes:,} nodes in {stats.seconds:.2f} s", done=True)
 
     console.log(
         f"{n}"
         f"{console.highlight('Grid generation complete', textColor=textColor.BLACK, bgColor=bgColor.GREEN)}"
         f"{n}"
+        f"{stats}"
+        f"{n}"
     )
 
     print(grid_nparray)
@@ -26,8 +26,8 @@ def run():
           "\n", "\n",
           "2) out_path        By default the function will save a "'grid.csv'" to your documents folder",
           "\n",
-          "                   This parameter will accept any *.csv or *.txt if it is provided as a properly formatted "
-          "path.",
+          "                   This parameter will accept any *.csv, *.txt, *.npy, *.npz, *.f32, *.f64 or *.parquet if "
+          "it is provided as a properly formatted path.",
           "\n", "\n",
           "3) in_epsg         Default value is 4326, the EPSG id for WGS84 geographic coordinate system with units in "
           "degrees (https://epsg.io/4326).",
@@ -60,7 +60,8 @@ def run():
     def output_mod():
         output_mod = input("Would you like to specify a different output path than the default value? (Y/N)")
         if output_mod == "Y":
-            out_path = input("Enter the fully formatted path to your output .txt or .csv.")
+            out_path = input("Enter the fully formatted path to your output .txt, .csv, .npy, .npz, .f32, .f64 or "
+                             ".parquet.")
         else:
             out_path = str(os.path.join(Path.home(), "Documents") + "\\grid.csv")
         return out_path
@@ -0,0 +1,256 @@
+"""
+NAME:           gridinput.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Reads only as much of the input vector file as the grid needs: the bounds of its first feature (the
+grid extent) and, for clipping and cache keys, that feature's geometry. gpd.read_file would build a GeoDataFrame of
+every feature first, which for a detailed shoreline or parish layer costs tens of seconds and gigabytes just to
+read one bounding box.
+    -   GeoJSON: the file is memory-mapped and scanned with numpy for the "geometry" member of the first feature
+        (bracket depth by cumulative sum, with string contents skipped, so a "geometry" inside the properties is not
+        mistaken for it), then its "coordinates" array is parsed straight into float arrays window by window to get
+        the bounds. No JSON objects are built; the geometry is only parsed (shapely.from_geojson, in GEOS) when it is
+        asked for. Only Point to MultiPolygon geometries are scanned.
+    -   Other formats (shapefile, GeoPackage, FlatGeobuf...) and GeoJSON the scan does not handle (GeometryCollection,
+        unexpected layouts): the driver computes the first feature's extent without building a geometry
+        (pyogrio.read_bounds), and the geometry is read from that one feature only (gpd.read_file(rows=1)).
+
+TO RUN:
+    -   Used by pocketgrid.py. On its own:
+          -  feature = InputFeature(path) - feature.bounds (minx, miny, maxx, maxy), feature.geometry (shapely)
+          -  bounds(path), geometry(path) - one-off shortcuts
+
+DATA FORMAT:    Any vector file geopandas can read; bounds are in the file's own CRS
+
+REQUIRES:       mmap, os, numpy, shapely (geometry), pyogrio / geopandas (non-GeoJSON input)
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import mmap
+import os
+import numpy as np
+
+GEOJSON_EXTENSIONS = ('.geojson', '.json')
+SCAN_BYTES = 1 << 24  # Bytes examined per numpy pass over the file
+NUMBERS = bytes.maketrans(b'[],', b'   ')  # Coordinate array punctuation -> number separators
+QUOTE, BACKSLASH = ord('"'), ord('\\')
+DEPTH_CHANGE = np.zeros(256, dtype=np.int8)  # Byte -> +1 opening bracket, -1 closing bracket
+DEPTH_CHANGE[[ord('{'), ord('[')]], DEPTH_CHANGE[[ord('}'), ord(']')]] = 1, -1
+WHITESPACE = b' \t\r\n'
+SCANNED_TYPES = (b'Point', b'MultiPoint', b'LineString', b'MultiLineString', b'Polygon', b'MultiPolygon')
+
+
+def _structure(buffer, start):
+    # Yields (position, byte, depth) arrays of the brackets outside strings and the opening quote of every string
+    # from `start` on, SCAN_BYTES at a time; depth is the nesting level before the byte, relative to `start`
+    depth, inside, pos = 0, False, start
+    while pos < len(buffer):
+        window = np.frombuffer(buffer, dtype=np.uint8, count=min(SCAN_BYTES, len(buffer) - pos), offset=pos)
+        # Depth and string state only change at brackets ('{' and '}' fold onto '[' and ']') and quotes
+        folded = window & 0xDF
+        found = np.flatnonzero((folded == ord('[')) | (folded == ord(']')) | (window == QUOTE))
+        chars = window[found]
+        quotes = chars == QUOTE
+        suspect = quotes & (window[np.maximum(found - 1, 0)] == BACKSLASH)
+        suspect[:1] |= quotes[:1] & (found[:1] == 0)  # The backslash may end the previous window
+        for index in np.flatnonzero(suspect):
+            quotes[index] = not _escaped(buffer, pos + int(found[index]))
+        chars = np.where((chars == QUOTE) & ~quotes, 0, chars)  # Escaped quotes are string content
+        count = np.cumsum(quotes)
+        outside = (count - quotes + inside) % 2 == 0  # Before each byte, no string is open
+        change = DEPTH_CHANGE[chars].astype(np.int64) * outside
+        levels = depth + np.cumsum(change)
+        keep = outside & (chars != 0)
+        yield pos + found[keep], chars[keep], (levels - change)[keep]
+        if found.size:
+            depth, inside = int(levels[-1]), bool((int(count[-1]) + inside) % 2)
+        pos += len(window)
+
+
+def _escaped(buffer, quote):
+    # Whether the quote at `quote` follows an odd run of backslashes
+    run = 0
+    while quote - run - 1 >= 0 and buffer[quote - run - 1] == BACKSLASH:
+        run += 1
+    return run % 2 == 1
+
+
+def _span_end(buffer, start):
+    # Offset just past the bracket closing the object or array opening at `start`; None if unclosed
+    for position, chars, depth in _structure(buffer, start):
+        closed = np.flatnonzero((depth == 1) & (DEPTH_CHANGE[chars] < 0))
+        if closed.size:
+            return int(position[closed[0]]) + 1
+    return None
+
+
+def _value(buffer, pos):
+    # Offset of the first byte from pos on that is not whitespace
+    while pos < len(buffer) and buffer[pos] in WHITESPACE:
+        pos += 1
+    return pos
+
+
+def _members(buffer, obj, *names):
+    # {name: offset of its value} for the direct members `names` of the object opening at `obj`; nested objects
+    # (properties holding a "geometry" of their own) and strings are skipped. Stops once all are found.
+    keys = {b'"' + name + b'"': name for name in names}
+    found = {}
+    for position, chars, depth in _structure(buffer, obj):
+        for quote in position[(chars == QUOTE) & (depth == 1)]:
+            quote = int(quote)
+            key = buffer[quote:buffer.find(b'"', quote + 1) + 1]
+            colon = _value(buffer, quote + len(key))
+            if key in keys and buffer[colon:colon + 1] == b':':
+                found.setdefault(keys[key], _value(buffer, colon + 1))
+                if len(found) == len(keys):
+                    return found
+        if ((depth == 1) & (chars == ord('}'))).any():  # The object closed
+            break
+    return found
+
+
+def _string(buffer, pos):
+    # The string value starting at pos (no escapes expected), None if it is not a string
+    if buffer[pos:pos + 1] != b'"':
+        return None
+    return buffer[pos + 1:buffer.find(b'"', pos + 1)]
+
+
+def _scan_bounds(buffer, start, end):
+    # Bounds of the coordinate array buffer[start:end]; parsed in windows cut after a ']' so no position is split
+    head = buffer[start:min(end, start + 4096)]
+    first = head.find(b']')
+    if first < 0:
+        return None
+    dimension = len(np.fromstring(head[head.rfind(b'[', 0, first) + 1:first].translate(NUMBERS), sep=' '))
+    if dimension < 2:
+        return None
+    low, high = np.full(2, np.inf), np.full(2, -np.inf)
+    pos = start
+    while pos < end:
+        cut = buffer.rfind(b']', pos, min(end, pos + SCAN_BYTES)) + 1 if pos + SCAN_BYTES < end else end
+        if cut <= pos:  # A single position longer than a window; not GeoJSON we can scan
+            return None
+        values = np.fromstring(buffer[pos:cut].translate(NUMBERS), sep=' ')
+        if values.size % dimension:
+            return None
+        xy = values.reshape(-1, dimension)[:, :2]
+        if len(xy):
+            low, high = np.minimum(low, xy.min(axis=0)), np.maximum(high, xy.max(axis=0))
+        pos = cut
+    if not np.isfinite(low).all():
+        return None
+    return float(low[0]), float(low[1]), float(high[0]), float(high[1])
+
+
+class InputFeature:
+    # First feature of a vector file; bounds and geometry are each read on first use and kept
+    def __init__(self, path):
+        self.path = str(path)
+        self._bounds = None
+        self._geometry = None
+        self._scannable = self.path.lower().endswith(GEOJSON_EXTENSIONS) and os.path.isfile(self.path)
+
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _geometry_start(self, buffer):
+        # Offset of the first feature's geometry object: the "geometry" member of the first element of "features",
+        # of a lone Feature, or the root of a bare geometry; None for a null geometry or anything else
+        root = _value(buffer, 0)
+        if buffer[root:root + 1] != b'{':
+            return None
+        features = _members(buffer, root, b'features').get(b'features')  # Stops at the key, near the start
+        if features is not None:
+            feature = _value(buffer, features + 1)
+            if buffer[features:features + 1] != b'[' or buffer[feature:feature + 1] != b'{':
+                return None
+            geometry = _members(buffer, feature, b'geometry').get(b'geometry')
+        else:
+            geometry = _members(buffer, root, b'geometry').get(b'geometry', root)
+        return geometry if geometry is not None and buffer[geometry:geometry + 1] == b'{' else None
+
+    def _scan(self):
+        # Bounds from the GeoJSON coordinate scan, None when the file is not laid out as expected. Only geometry types
+        # made of one coordinate array are scanned; GeometryCollection and the rest are left to the driver.
+        if os.path.getsize(self.path) == 0:
+            return None
+        buffer = self._open()
+        try:
+            geometry = self._geometry_start(buffer)
+            if geometry is None:
+                return None
+            members = _members(buffer, geometry, b'type', b'coordinates')
+            if b'type' not in members or _string(buffer, members[b'type']) not in SCANNED_TYPES:
+                return None
+            coordinates = members.get(b'coordinates')
+            if coordinates is None or buffer[coordinates:coordinates + 1] != b'[':
+                return None
+            end = _span_end(buffer, coordinates)
+            return None if end is None else _scan_bounds(buffer, coordinates, end)
+        finally:
+            buffer.close()
+
+    def _read_one(self):
+        import geopandas as gpd
+        return gpd.read_file(self.path, rows=1).geometry.iloc[0]
+
+    @property
+    def bounds(self):
+        if self._bounds is None:
+            if self._geometry is not None:
+                self._bounds = tuple(float(value) for value in self._geometry.bounds)
+            elif self._scannable:
+                self._bounds = self._scan()
+            if self._bounds is None:
+                self._bounds = self._driver_bounds()
+        return self._bounds
+
+    def _driver_bounds(self):
+        try:
+            import pyogrio
+        except ImportError:  # Older geopandas installs read through fiona only
+            return tuple(float(value) for value in self.geometry.bounds)
+        _, extent = pyogrio.read_bounds(self.path, max_features=1)
+        if extent.shape[1] == 0:
+            raise ValueError(f"{self.path} has no features")
+        if not np.isfinite(extent[:, 0]).all():
+            raise ValueError(f"The first feature of {self.path} has no geometry")
+        return tuple(float(value) for value in extent[:, 0])
+
+    @property
+    def geometry(self):
+        if self._geometry is None:
+            self._geometry = self._parse() if self._scannable else None
+            if self._geometry is None:
+                self._geometry = self._read_one()
+        return self._geometry
+
+    def _parse(self):
+        import shapely
+        buffer = self._open()
+        try:
+            start = self._geometry_start(buffer)
+            end = None if start is None else _span_end(buffer, start)
+            return None if end is None else shapely.from_geojson(buffer[start:end])
+        finally:
+            buffer.close()
+
+
+def bounds(path):
+    return InputFeature(path).bounds
+
+
+def geometry(path):
+    return InputFeature(path).geometry
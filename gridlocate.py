@@ -0,0 +1,97 @@
+"""
+NAME:           gridlocate.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Maps batches of observation points (gauges, survey soundings) to their nearest grid node or containing
+grid cell. Points are reprojected to the grid CRS in bulk (chunked array calls on one cached Transformer across a
+thread pool, see reproject.py). On a regular lattice (LazyGrid) the lookup is pure arithmetic on origin and spacing,
+so millions of points cost a few array operations and no index has to be built. Clipped grids and irregular node
+arrays (e.g. a loaded output) fall back to a shapely STRtree over the nodes.
+
+TO RUN:
+    -   Build the grid with pocketgrid.lazy_grid() or pocketgrid.grid_source(..., clip=True), or load any output with
+        gridwriters.load(), then:
+          -  locate(grid, points, crs=4326) - (node index, distance in grid CRS units) for each point
+          -  locate_cells(grid, points, crs=4326) - index of the containing cell, -1 outside (regular lattices only)
+    -   For repeated lookups against one clipped or irregular grid, build NodeIndex(nodes) once and pass it as grid
+
+DATA FORMAT:    points is an (n, 2) array of x,y (lon,lat for EPSG 4326) in crs; crs=None means the grid's own CRS
+
+REQUIRES:       numpy, shapely (spatial index fallback), projcache (pyproj), reproject, lazygrid, polyclip
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import projcache
+import reproject
+from lazygrid import LazyGrid
+from polyclip import ClippedGrid
+
+
+class NodeIndex:
+    # STRtree over an arbitrary set of nodes; indices returned are positions in the node array
+    def __init__(self, nodes, epsg=None):
+        import shapely
+        self.nodes = np.asarray(nodes, dtype=np.float64)[:, :2]
+        self.epsg = epsg
+        self.tree = shapely.STRtree(shapely.points(self.nodes))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def nearest(self, x, y):
+        import shapely
+        index = np.full(np.shape(x), -1, dtype=np.int64)
+        distance = np.full(np.shape(x), np.inf)
+        if len(self.nodes) == 0:
+            return index, distance
+        (point, node), found = self.tree.query_nearest(shapely.points(x, y), return_distance=True, all_matches=False)
+        index[point], distance[point] = node, found
+        return index, distance
+
+
+def _grid_epsg(grid):
+    if isinstance(grid, ClippedGrid):
+        return grid.lazy.epsg
+    return getattr(grid, 'epsg', None)
+
+
+def to_grid_crs(grid, points, crs=None, threads=None):
+    # (x, y) arrays of the points in the grid's CRS, reprojected in bulk when crs differs
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    epsg = _grid_epsg(grid)
+    if crs is None or crs == epsg:
+        return points[:, 0], points[:, 1]
+    if epsg is None:
+        raise ValueError("The grid has no EPSG id to reproject the points to; use NodeIndex(nodes, epsg) or crs=None")
+    transformer = projcache.get_transformer(crs, epsg)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        xy = reproject.transform_block(points, transformer, pool)
+    return xy[:, 0], xy[:, 1]
+
+
+def locate(grid, points, crs=None, threads=None):
+    # (node index, distance) of the nearest grid node to each point. grid is a LazyGrid, ClippedGrid, NodeIndex or
+    # an (n, 2) node array; distances are in grid CRS units (metres for UTM).
+    if not isinstance(grid, (LazyGrid, NodeIndex)):  # Clipped and irregular grids: spatial index over the nodes
+        grid = NodeIndex(grid.to_numpy() if isinstance(grid, ClippedGrid) else grid, _grid_epsg(grid))
+    x, y = to_grid_crs(grid, points, crs, threads)
+    return grid.nearest(x, y)
+
+
+def locate_cells(grid, points, crs=None, threads=None):
+    # Index of the lattice cell containing each point (see LazyGrid.cell_index); -1 outside the grid
+    if not isinstance(grid, LazyGrid):
+        raise TypeError("Cells are only defined on a regular lattice (LazyGrid); use locate() for nearest nodes")
+    x, y = to_grid_crs(grid, points, crs, threads)
+    return grid.cell_index(x, y)
@@ -0,0 +1,151 @@
+"""
+NAME:           gridpreview.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Bounded-size preview of a generated grid for the folium map in mapper.py, to check a grid before
+committing to a long run. Instead of one marker per node, the preview is a node density raster rendered with NumPy
+(a histogram of the nodes in Web Mercator, so it lines up with the basemap without resampling) plus a small sample
+of the nodes drawn as dots. Both are built from a decimated node set: regular and clipped lattices are thinned by a
+lattice stride before any node is generated, other grids (arrays, memmaps, adaptive grids) by a stride over their
+blocks. The HTML added to the map is bounded by the raster size and sample count, whatever the number of nodes.
+
+TO RUN:
+    -   mapper(preview=grid) overlays the preview on the bounding box map, where grid is the array returned by
+        pocketgrid.grid (pass its out_epsg as preview_epsg) or a LazyGrid, ClippedGrid or QuadtreeGrid
+    -   Or add it to any folium map: add_preview(m, grid, epsg=None, pixels=PREVIEW_PIXELS, points=PREVIEW_POINTS)
+
+DATA FORMAT:    Grid nodes as easting,northing in the grid's EPSG; the raster is an RGBA numpy array at most pixels
+wide or high
+
+REQUIRES:       numpy, projcache (pyproj), reproject, lazygrid, polyclip, folium (add_preview only)
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import projcache
+import reproject
+from lazygrid import LazyGrid
+from polyclip import ClippedGrid
+
+PREVIEW_PIXELS = 384  # Longest side of the density raster
+PREVIEW_NODES = 1 << 20  # Nodes binned into the raster at most
+PREVIEW_POINTS = 2000  # Nodes drawn as dots at most
+PREVIEW_COLOR = (0, 110, 255)  # '#006EFF', the mapper highlight colour
+WEB_MERCATOR = 3857
+
+
+def _epsg(grid, epsg=None):
+    if epsg is None:
+        epsg = grid.lazy.epsg if isinstance(grid, ClippedGrid) else getattr(grid, 'epsg', None)
+        if epsg is None and hasattr(grid, 'meta'):
+            epsg = grid.meta.get('epsg')
+    if epsg is None:
+        raise ValueError("The grid has no EPSG id; pass epsg to preview a plain node array")
+    return epsg
+
+
+def _coarse(lazy, stride):
+    # Every stride-th column and row of the lattice, as a lattice of its own
+    shape = ((lazy.columns - 1) // stride + 1, (lazy.rows - 1) // stride + 1)
+    return LazyGrid(lazy.origin, lazy.spacing * stride, shape, epsg=lazy.epsg, order=lazy.order)
+
+
+def sample_blocks(grid, max_nodes):
+    # Yields easting,northing blocks of about max_nodes nodes spread evenly over the grid
+    if isinstance(grid, (LazyGrid, ClippedGrid)):
+        lazy = grid.lazy if isinstance(grid, ClippedGrid) else grid
+        stride = max(1, int(np.ceil(np.sqrt(len(lazy) / max_nodes))))
+        coarse = _coarse(lazy, stride)
+        source = coarse if isinstance(grid, LazyGrid) else ClippedGrid(coarse, grid.polygon)
+        for block in source.iter_blocks(dtype=np.float64):
+            yield block
+        return
+    stride = max(1, -(-len(grid) // max_nodes))
+    blocks = grid.iter_blocks() if hasattr(grid, 'iter_blocks') else [np.asarray(grid)]
+    offset = 0
+    for block in blocks:
+        for start in range(0, len(block), 1 << 16):  # Bounded slices, so memmapped grids are read piecewise
+            part = block[start:start + (1 << 16)]
+            yield np.asarray(part[(-offset) % stride::stride, :2], dtype=np.float64)
+            offset += len(part)
+
+
+def _transformed(blocks, epsg, out_epsg, threads=None):
+    # Blocks reprojected to out_epsg, concatenated
+    transformer = projcache.get_transformer(epsg, out_epsg)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        parts = [reproject.transform_block(block, transformer, pool) for block in blocks if len(block)]
+    return np.concatenate(parts) if parts else np.empty((0, 2))
+
+
+def _smooth(counts, filled):
+    # Mean count over the filled pixels of each 3 x 3 window; evens out the beat between the lattice and the pixels
+    total, cells = np.zeros_like(counts), np.zeros_like(counts)
+    padded_counts, padded_filled = np.pad(counts, 1), np.pad(filled.astype(counts.dtype), 1)
+    rows, columns = counts.shape
+    for dy in range(3):
+        for dx in range(3):
+            total += padded_counts[dy:dy + rows, dx:dx + columns]
+            cells += padded_filled[dy:dy + rows, dx:dx + columns]
+    return total / np.maximum(cells, 1)
+
+
+def density_image(grid, epsg=None, pixels=PREVIEW_PIXELS, max_nodes=PREVIEW_NODES, color=PREVIEW_COLOR,
+                  threads=None):
+    # (RGBA uint8 image, [[south, west], [north, east]]) of the node density; None for an empty grid. The image is
+    # binned in Web Mercator, the projection of the basemap, so stretching it over the bounds places it exactly.
+    epsg = _epsg(grid, epsg)
+    xy = _transformed(sample_blocks(grid, max_nodes), epsg, WEB_MERCATOR, threads)
+    if len(xy) == 0:
+        return None
+    low, high = xy.min(axis=0), xy.max(axis=0)
+    extent = np.maximum(high - low, 1e-6)
+    cell = max(extent.max() / pixels, 2 * np.sqrt(extent.prod() / len(xy)))  # Several nodes per pixel, no holes
+    bins = np.maximum(np.ceil(extent / cell).astype(int), 1)
+    high = low + bins * cell  # Square pixels
+    counts, _, _ = np.histogram2d(xy[:, 0], xy[:, 1], bins=bins, range=[[low[0], high[0]], [low[1], high[1]]])
+    counts = counts.T[::-1]  # Rows north to south
+    image = np.zeros(counts.shape + (4,), dtype=np.uint8)
+    image[..., :3] = color
+    filled = counts > 0
+    if filled.any():
+        level = np.log1p(_smooth(counts, filled)[filled])
+        image[..., 3][filled] = (80 + 150 * level / level.max()).astype(np.uint8)
+    corners = _transformed([np.array([low, high])], WEB_MERCATOR, 4326)
+    bounds = [[float(corners[0, 1]), float(corners[0, 0])], [float(corners[1, 1]), float(corners[1, 0])]]
+    return image, bounds
+
+
+def sample_points(grid, epsg=None, points=PREVIEW_POINTS, decimals=6, threads=None):
+    # (n, 2) lon,lat array of at most about `points` nodes spread over the grid
+    epsg = _epsg(grid, epsg)
+    return np.round(_transformed(sample_blocks(grid, points), epsg, 4326, threads), decimals)
+
+
+def add_preview(m, grid, epsg=None, pixels=PREVIEW_PIXELS, points=PREVIEW_POINTS, name="Grid preview"):
+    # Adds the density raster and the node sample to the folium map m as one toggleable layer; returns the layer
+    import folium
+    from folium import raster_layers
+    layer = folium.FeatureGroup(name=f"{name} ({len(grid):,} nodes)")
+    rendered = density_image(grid, epsg, pixels)
+    if rendered is not None:
+        image, bounds = rendered
+        raster_layers.ImageOverlay(image, bounds=bounds, opacity=1, interactive=False).add_to(layer)
+    lonlat = sample_points(grid, epsg, points)
+    if len(lonlat):
+        folium.GeoJson({'type': 'Feature', 'properties': {},
+                        'geometry': {'type': 'MultiPoint', 'coordinates': lonlat.tolist()}},
+                       marker=folium.CircleMarker(radius=2, weight=1, color='#004CA8', fill=True, fill_opacity=1),
+                       ).add_to(layer)
+    layer.add_to(m)
+    return layer
@@ -0,0 +1,203 @@
+"""
+NAME:           gridstats.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Per-stage instrumentation of grid runs, for finding which stage of a slow run is at fault: reading the
+input, building the CRS transformer, transforming the corners, generating the lattice, writing the output and
+materialising the returned array. Each stage records wall time, nodes, bytes written and the peak memory it added.
+Generation and writing are streamed together, so the block stream is wrapped and the time spent producing blocks is
+booked to 'generate' and the rest to 'write' (the CSV lattice fast path generates formatted text instead of blocks;
+producing that text is what it books to 'generate'). An optional callback is called at the end of every stage and
+after every block with the stats object, whose done/total/rate/eta drive a progress line (see gridinit.py). Runs
+without a stats object take the plain code path, so instrumentation costs nothing unless asked for.
+
+TO RUN:
+    -   stats = GridStats(callback=None, trace_memory=False); pocketgrid.grid(..., stats=stats); print(stats)
+    -   A stage's peak memory is by default how much it raised the process high-water mark (resident set size), so
+        a stage that stayed under the peak set by an earlier one reports 0; trace_memory=True measures the peak of
+        each stage on its own with tracemalloc, which slows the run down
+
+DATA FORMAT:    stats.as_dict() -> {'seconds', 'nodes', 'bytes', 'stages': [{'name', 'seconds', 'nodes', 'bytes',
+'peak_memory'}, ...]}; peak_memory in bytes (growth of the process peak, or the tracemalloc peak), None where it
+cannot be measured
+
+REQUIRES:       os, sys, time, tracemalloc, contextlib, resource (not on Windows; peak memory is then None)
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss():
+    # High-water mark of the process's resident memory in bytes, None where unavailable
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux reports kilobytes
+
+
+def output_bytes(path):
+    # Size of an output plus its .json sidecar (raw format), 0 if nothing was written
+    return sum(os.path.getsize(p) for p in (str(path), str(path) + '.json') if os.path.exists(p))
+
+
+class StageStats:
+    __slots__ = ('name', 'seconds', 'nodes', 'bytes', 'peak_memory')
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.nodes = 0
+        self.bytes = 0
+        self.peak_memory = None
+
+    def as_dict(self):
+        return {'name': self.name, 'seconds': self.seconds, 'nodes': self.nodes, 'bytes': self.bytes,
+                'peak_memory': self.peak_memory}
+
+
+class GridStats:
+    def __init__(self, callback=None, trace_memory=False):
+        self.callback = callback
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.current = None  # Name of the running stage
+        self.total = None  # Nodes the run will produce, once known
+        self.done = 0  # Nodes generated or written so far
+        self._progress_start = None
+        self._tracked = 0.0  # Seconds booked by track(), taken out of the stage that consumed the blocks
+
+    def _stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = StageStats(name)
+        return self.stages[name]
+
+    def _notify(self):
+        if self.callback is not None:
+            self.callback(self)
+
+    @contextmanager
+    def stage(self, name, nodes=None):
+        # Times the body as stage `name`; repeated stages accumulate
+        stage = self._stage(name)
+        self.current = name
+        tracked = self._tracked
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+        start_peak = None if self.trace_memory else peak_rss()
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds += time.perf_counter() - start - (self._tracked - tracked)
+            if nodes is not None:
+                stage.nodes += nodes
+            if self.trace_memory:
+                stage.peak_memory = max(stage.peak_memory or 0, tracemalloc.get_traced_memory()[1])
+                if tracing:
+                    tracemalloc.stop()
+            elif start_peak is not None:  # How far the stage raised the process high-water mark
+                stage.peak_memory = max(stage.peak_memory or 0, peak_rss() - start_peak)
+            self._notify()
+
+    def start_progress(self, total):
+        self.total = total
+        self.done = 0
+        self._progress_start = time.perf_counter()
+
+    def track(self, blocks, name='generate', count=len):
+        # Wraps a block stream: time spent producing each block is booked to stage `name` (and not to the stage
+        # consuming the stream), count(block) nodes are counted and the callback is called after every block
+        stage = self._stage(name)
+        blocks = iter(blocks)
+        while True:
+            start = time.perf_counter()
+            try:
+                block = next(blocks)
+            except StopIteration:
+                block = None
+            seconds = time.perf_counter() - start
+            stage.seconds += seconds
+            self._tracked += seconds
+            if block is None:
+                return
+            stage.nodes += count(block)
+            self.done += count(block)
+            self._notify()
+            yield block
+
+    def track_chunks(self, chunks, name='generate'):
+        # track() for the (text, nodes) chunks of the CSV lattice fast path, which generates and formats the nodes
+        # itself: producing the text is booked to 'generate', writing it to the stage consuming the chunks
+        return self.track(chunks, name, count=lambda chunk: chunk[1])
+
+    @property
+    def elapsed(self):
+        return 0.0 if self._progress_start is None else time.perf_counter() - self._progress_start
+
+    @property
+    def rate(self):
+        # Nodes per second of the current generate/write pass
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        # Seconds left in the current generate/write pass, None while unknown
+        rate = self.rate
+        if not self.total or rate <= 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    @property
+    def seconds(self):
+        return sum(stage.seconds for stage in self.stages.values())
+
+    @property
+    def nodes(self):
+        return max([stage.nodes for stage in self.stages.values()] + [0])
+
+    @property
+    def bytes(self):
+        return sum(stage.bytes for stage in self.stages.values())
+
+    def as_dict(self):
+        return {'seconds': self.seconds, 'nodes': self.nodes, 'bytes': self.bytes,
+                'stages': [stage.as_dict() for stage in self.stages.values()]}
+
+    def __str__(self):
+        peak = 'traced MB' if self.trace_memory else '+peak MB'  # Stage peak, or growth of the process peak
+        lines = [f"{'stage':<12}{'seconds':>10}{'nodes':>15}{'nodes/s':>14}{'MB':>10}{peak:>10}"]
+        for stage in self.stages.values():
+            rate = f"{stage.nodes / stage.seconds:,.0f}" if stage.nodes and stage.seconds > 0 else '-'
+            peak = '-' if stage.peak_memory is None else f"{stage.peak_memory / 1e6:.1f}"
+            lines.append(f"{stage.name:<12}{stage.seconds:>10.3f}{stage.nodes:>15,}{rate:>14}"
+                         f"{stage.bytes / 1e6:>10.2f}{peak:>10}")
+        lines.append(f"{'total':<12}{self.seconds:>10.3f}")
+        return '\n'.join(lines)
+
+
+def stage(stats, name, nodes=None):
+    # stats.stage(name) or a no-op context when the run is not instrumented
+    return nullcontext() if stats is None else stats.stage(name, nodes)
@@ -0,0 +1,346 @@
+"""
+NAME:           gridwriters.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Output writers for the lattice produced by gridengine. Writers consume easting,northing blocks as they
+are generated so the full grid never has to be held in memory. The output format is chosen from the out_path
+extension or an explicit fmt:
+    -   csv      .csv, .txt              plaintext easting,northing
+    -   csv.gz   .csv.gz, .gz            plaintext compressed in independent blocks on a thread pool and written as a
+        csv.xz   .csv.xz, .xz            multi-member gzip / multi-stream xz file that stock tools read as one stream
+    -   npy      .npy                    memory-mapped numpy array
+    -   npz      .npz                    compressed numpy archive holding a single "grid" array
+    -   raw      .f32, .f64, .bin, .raw  little-endian float32/float64 pairs plus a .json sidecar describing the
+                                         grid (EPSG, origin, spacing, shape). float32 cannot hold projected
+                                         coordinates exactly (UTM eastings round by centimetres); a warning gives the
+                                         largest error whenever it rounds
+    -   parquet  .parquet                GeoParquet with easting, northing and WKB point geometry (requires pyarrow)
+    The binary formats at float64 read back exactly the nodes grid() returns.
+
+TO RUN:
+    -   Imported by pocketgrid.py. Not intended to be run on its own.
+
+DATA FORMAT:    Iterable of (n, 2) numpy arrays of easting,northing and a metadata dict with the node count and, for
+                a regular lattice, EPSG, origin, spacing and shape (columns, rows). Blocks widened by reproject.py
+                carry extra coordinate columns named in meta['columns'].
+
+REQUIRES:       gzip, json, lzma, os, warnings, zipfile, collections, concurrent.futures, numpy, pyarrow and projcache
+                (only for parquet)
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import gzip
+import json
+import lzma
+import os
+import warnings
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+COLUMNS = ['easting', 'northing']
+CSV_HEADER = ','.join(COLUMNS)
+CSV_CHUNK_ROWS = 1 << 16  # Rows formatted per buffered write
+EXTENSIONS = {'.csv': 'csv', '.txt': 'csv', '.npy': 'npy', '.npz': 'npz', '.f32': 'raw', '.f64': 'raw', '.bin': 'raw',
+              '.raw': 'raw', '.parquet': 'parquet', '.geoparquet': 'parquet', '.gz': 'csv.gz', '.xz': 'csv.xz'}
+COMPRESS_CHUNK_ROWS = 1 << 18  # Rows per independently compressed member (about 8 MB of text)
+COMPRESS_LEVELS = {'gzip': 1, 'xz': 1}  # Fastest levels: CSV compresses ~10x (gzip) and ~100x (xz) even so
+COMPRESSED_EXTENSIONS = ('.gz', '.xz')  # Kept together with the extension before them in derived output names
+RAW_DTYPES = {'.f32': np.dtype('<f4'), '.f64': np.dtype('<f8')}
+
+
+def split_extension(out_path):
+    # os.path.splitext keeping a compression suffix with the extension before it: grid.csv.gz -> grid, .csv.gz
+    root, ext = os.path.splitext(str(out_path))
+    if ext.lower() in COMPRESSED_EXTENSIONS:
+        inner_root, inner = os.path.splitext(root)
+        if inner:
+            return inner_root, inner + ext
+    return root, ext
+
+
+def column_names(meta):
+    # Column names of the blocks described by meta; extra columns (e.g. lon, lat) follow easting,northing
+    return meta.get('columns', COLUMNS)
+
+
+def write_npy(out_path, blocks, meta, dtype=np.float64, **options):
+    # Pre-size a memory-mapped .npy from the node count and fill it block by block; returns the memmap itself
+    rows = meta['count']
+    grid_memmap = np.lib.format.open_memmap(out_path, mode='w+', dtype=dtype, shape=(rows, len(column_names(meta))))
+    offset = 0
+    for block in blocks:
+        grid_memmap[offset:offset + len(block)] = block
+        offset += len(block)
+    if offset != rows:
+        raise ValueError(f"Expected {rows} grid nodes but received {offset}")
+    grid_memmap.flush()
+    return grid_memmap
+
+
+def format_values(values, precision=6):
+    return ['{:.{}f}'.format(value, precision) for value in np.asarray(values, dtype=np.float64).tolist()]
+
+
+def format_csv(block, precision=6, prefix=''):
+    # Format an (n, k) block as CSV rows with a single format call, identical to '{:f},{:f}\n' per row at precision 6.
+    # precision may also be a list with one entry per column. prefix is written verbatim at the start of every row
+    # (e.g. a feature id column).
+    block = np.asarray(block, dtype=np.float64)
+    if block.size == 0:
+        return ''
+    precisions = precision if isinstance(precision, (list, tuple)) else [precision] * block.shape[1]
+    row = prefix.replace('{', '{{').replace('}', '}}') + ','.join(['{:.%df}' % p for p in precisions]) + '\n'
+    return (row * len(block)).format(*block.ravel().tolist())
+
+
+def csv_chunks(blocks, precision=6, prefix='', rows=CSV_CHUNK_ROWS):
+    # Yields (text, nodes) for every `rows` rows of the blocks
+    for block in blocks:
+        for start in range(0, len(block), rows):
+            chunk = block[start:start + rows]
+            yield format_csv(chunk, precision, prefix), len(chunk)
+
+
+def lattice_csv_chunks(xs, ys, precision=6, order='column', prefix='', rows=CSV_CHUNK_ROWS):
+    # Fast path for a regular lattice: each axis value is formatted once and whole columns (or rows) are assembled
+    # with str.join, so the per-node cost is a string copy rather than a float format call. Yields (text, nodes) for
+    # whole lines of about `rows` rows.
+    eastings = format_values(xs, precision)
+    northings = format_values(ys, precision)
+    if order == 'column':  # Northings vary fastest within each easting, as in pocketgrid.grid
+        lines = (x + ',' + ('\n' + x + ',').join(northings) + '\n' for x in (prefix + x for x in eastings))
+        per_line = len(northings)
+    elif order == 'row':
+        lines = (prefix + (suffix + prefix).join(eastings) + suffix for suffix in (',' + y + '\n' for y in northings))
+        per_line = len(eastings)
+    else:
+        raise ValueError(f"order must be 'column' or 'row', not {order!r}")
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) * per_line >= rows:
+            yield ''.join(buffer), len(buffer) * per_line
+            buffer = []
+    if buffer:
+        yield ''.join(buffer), len(buffer) * per_line
+
+
+def _write_text(out_path, chunks, header=CSV_HEADER, progress=None):
+    with open(out_path, 'w') as of:
+        if header is not None:
+            of.write(header + '\n')
+        for text, nodes in chunks:
+            of.write(text)
+            if progress is not None:
+                progress(nodes)
+
+
+def write_csv(out_path, blocks, precision=6, header=CSV_HEADER, prefix=''):
+    # Write blocks of easting,northing to plaintext, formatting CSV_CHUNK_ROWS rows per buffered write.
+    # header=None writes the rows only.
+    _write_text(out_path, csv_chunks(blocks, precision, prefix), header)
+
+
+def write_lattice_csv(out_path, xs, ys, precision=6, order='column', header=CSV_HEADER, prefix='', progress=None):
+    # Plaintext of a regular lattice from its axes (see lattice_csv_chunks). progress, if given, is called with the
+    # number of nodes in every chunk written.
+    _write_text(out_path, lattice_csv_chunks(xs, ys, precision, order, prefix), header, progress)
+
+
+def _compress(text, compression, level):
+    # One complete gzip member or xz stream; zlib and lzma release the GIL, so chunks compress in parallel threads
+    if compression == 'gzip':
+        return gzip.compress(text.encode(), compresslevel=level, mtime=0)
+    return lzma.compress(text.encode(), format=lzma.FORMAT_XZ, preset=level)
+
+
+def write_compressed_text(out_path, chunks, compression='gzip', level=None, header=CSV_HEADER, threads=None,
+                          progress=None):
+    # Compresses the text chunks independently on a thread pool and writes them in order as a multi-member gzip (or
+    # multi-stream xz) file, which gzip -d, xz -d, zcat, pandas and numpy read as one stream. At most two chunks per
+    # thread are in flight, so memory stays bounded.
+    level = COMPRESS_LEVELS[compression] if level is None else level
+    threads = threads or os.cpu_count() or 1
+    pending = deque()
+    first = header + '\n' if header is not None else ''  # Header goes into the first member
+    with open(out_path, 'wb') as of, ThreadPoolExecutor(max_workers=threads) as pool:
+        for text, nodes in chunks:
+            pending.append((pool.submit(_compress, first + text, compression, level), nodes))
+            first = ''
+            while len(pending) > 2 * threads:
+                future, done = pending.popleft()
+                of.write(future.result())
+                if progress is not None:
+                    progress(done)
+        if first:  # No rows at all
+            pending.append((pool.submit(_compress, first, compression, level), 0))
+        while pending:
+            future, done = pending.popleft()
+            of.write(future.result())
+            if progress is not None:
+                progress(done)
+
+
+def write_npz(out_path, blocks, meta, dtype=np.float64, **options):
+    # Stream blocks into a deflate-compressed .npz member named "grid" without assembling the array in memory
+    dtype, rows = np.dtype(dtype), meta['count']
+    with zipfile.ZipFile(out_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        with zf.open('grid.npy', 'w', force_zip64=True) as member:
+            np.lib.format.write_array_header_1_0(member, {'descr': np.lib.format.dtype_to_descr(dtype),
+                                                          'fortran_order': False,
+                                                          'shape': (rows, len(column_names(meta)))})
+            written = 0
+            for block in blocks:
+                member.write(np.ascontiguousarray(block, dtype=dtype).tobytes())
+                written += len(block)
+    if written != rows:
+        raise ValueError(f"Expected {rows} grid nodes but received {written}")
+
+
+def sidecar_path(out_path):
+    return str(out_path) + '.json'
+
+
+def write_raw(out_path, blocks, meta, dtype=np.float64, **options):
+    # Little-endian easting,northing pairs with a JSON sidecar; .f32 and .f64 extensions fix the dtype
+    dtype = RAW_DTYPES.get(os.path.splitext(str(out_path))[1].lower(), np.dtype(dtype).newbyteorder('<'))
+    error = 0.0  # Largest rounding error of a narrower dtype than the float64 blocks
+    with open(out_path, 'wb') as of:
+        for block in blocks:
+            out = np.ascontiguousarray(block, dtype=dtype)
+            out.tofile(of)
+            if dtype.itemsize < 8 and len(out):
+                error = max(error, float(np.abs(out.astype(np.float64) - block).max()))
+    if error > 0:
+        warnings.warn(f"{out_path} is stored as {dtype.name}, which rounds the coordinates by up to {error:g} CRS "
+                      f"units; use .f64 for an exact copy of the grid", UserWarning, stacklevel=3)
+    with open(sidecar_path(out_path), 'w') as of:
+        json.dump(dict(meta, dtype=dtype.str, columns=column_names(meta)), of, indent=2)
+
+
+def _wkb_points(block):
+    # Little-endian WKB Point records (21 bytes each) built as one structured array
+    wkb = np.empty(len(block), dtype=np.dtype([('order', 'u1'), ('type', '<u4'), ('x', '<f8'), ('y', '<f8')]))
+    wkb['order'] = 1
+    wkb['type'] = 1
+    wkb['x'] = block[:, 0]
+    wkb['y'] = block[:, 1]
+    return wkb
+
+
+def write_parquet(out_path, blocks, meta, dtype=np.float64, **options):
+    # GeoParquet 1.0: one row group per block with the value columns and a WKB point geometry of easting,northing
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("GeoParquet output requires pyarrow (pip install pyarrow)") from e
+    import projcache
+    column = {'encoding': 'WKB', 'geometry_types': ['Point']}
+    if meta.get('epsg') is not None:
+        column['crs'] = projcache.get_crs(meta['epsg']).to_json_dict()
+    value_type = pa.from_numpy_dtype(np.dtype(dtype))
+    names = column_names(meta)
+    schema = pa.schema([(name, value_type) for name in names] + [('geometry', pa.binary())],
+                       metadata={'geo': json.dumps({'version': '1.0.0', 'primary_column': 'geometry',
+                                                    'columns': {'geometry': column}})})
+    with pq.ParquetWriter(out_path, schema) as writer:
+        for block in blocks:
+            block = np.ascontiguousarray(block, dtype=dtype)
+            wkb = _wkb_points(block)
+            offsets = np.arange(0, (len(block) + 1) * wkb.itemsize, wkb.itemsize, dtype=np.int32)
+            geometry = pa.Array.from_buffers(pa.binary(), len(block),
+                                             [None, pa.py_buffer(offsets), pa.py_buffer(wkb.tobytes())])
+            values = [pa.array(block[:, i]) for i in range(len(names))]
+            writer.write_table(pa.table(values + [geometry], schema=schema))
+
+
+def _lattice_axes(meta):
+    # Rebuild the axis vectors of a regular lattice from its metadata, identical to gridengine.axis and LazyGrid.axes.
+    # A tile (see tiling.py) is an offset window onto a larger lattice whose origin the metadata keeps.
+    columns, rows = meta['shape']
+    column, row = meta.get('offset', (0, 0))
+    xs = meta['origin'][0] + np.arange(column, column + columns, dtype=np.float64) * meta['spacing']
+    ys = meta['origin'][1] + np.arange(row, row + rows, dtype=np.float64) * meta['spacing']
+    return xs, ys
+
+
+def output_format(out_path, fmt=None):
+    if fmt is None:  # Unrecognised extensions keep the historical plaintext output
+        fmt = EXTENSIONS.get(os.path.splitext(str(out_path).lower())[1], 'csv')
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown output format {fmt!r}; expected one of {sorted(WRITERS)}")
+    return fmt
+
+
+def write_grid_csv(out_path, blocks, meta, dtype=np.float64, precision=6, header=CSV_HEADER, prefix='',
+                   compression=None, **options):
+    # Plaintext output, gzip or xz compressed in parallel blocks when compression is given
+    if header == CSV_HEADER:
+        header = ','.join(column_names(meta))
+    if 'column_precision' in meta:  # e.g. {'level': 0} writes an integer level column
+        precision = [meta['column_precision'].get(name, precision) for name in column_names(meta)]
+    if 'shape' in meta and 'columns' not in meta:  # Regular lattice: axis fast path at full float64 precision
+        xs, ys = _lattice_axes(meta)
+        rows = CSV_CHUNK_ROWS if compression is None else COMPRESS_CHUNK_ROWS
+        chunks = lattice_csv_chunks(xs, ys, precision, meta.get('order', 'column'), prefix, rows)
+        progress = options.get('progress')
+        if options.get('generated') is not None:  # e.g. GridStats.track_chunks: times and counts the chunks itself
+            chunks, progress = options['generated'](chunks), None
+    else:
+        chunks = csv_chunks(blocks, precision, prefix, CSV_CHUNK_ROWS if compression is None else COMPRESS_CHUNK_ROWS)
+        progress = None  # Nodes are counted as the blocks are consumed
+    if compression is None:
+        _write_text(out_path, chunks, header, progress)
+    else:
+        write_compressed_text(out_path, chunks, compression, options.get('compress_level'), header,
+                              options.get('threads'), progress)
+
+
+def write_csv_gz(out_path, blocks, meta, dtype=np.float64, **options):
+    return write_grid_csv(out_path, blocks, meta, dtype, compression='gzip', **options)
+
+
+def write_csv_xz(out_path, blocks, meta, dtype=np.float64, **options):
+    return write_grid_csv(out_path, blocks, meta, dtype, compression='xz', **options)
+
+
+# Writers take (out_path, blocks, meta, dtype, **options); add an entry here and in EXTENSIONS for a new format
+WRITERS = {'csv': write_grid_csv, 'csv.gz': write_csv_gz, 'csv.xz': write_csv_xz, 'npy': write_npy, 'npz': write_npz,
+           'raw': write_raw, 'parquet': write_parquet}
+
+
+def write(out_path, blocks, meta, fmt=None, dtype=np.float64, **options):
+    # Dispatch to the writer for fmt (or the out_path extension); returns the memmap for npy, otherwise None
+    return WRITERS[output_format(out_path, fmt)](out_path, blocks, meta, dtype=dtype, **options)
+
+
+def load(in_path, fmt=None):
+    # Read any output written above back into an (n, 2) easting,northing array, (n, 4) with extra coordinate columns
+    # (npy is memory-mapped)
+    fmt = output_format(in_path, fmt)
+    if fmt in ('csv', 'csv.gz', 'csv.xz'):  # numpy decompresses .gz and .xz files itself
+        return np.loadtxt(in_path, delimiter=',', skiprows=1, ndmin=2)
+    if fmt == 'npy':
+        return np.load(in_path, mmap_mode='r')
+    if fmt == 'npz':
+        with np.load(in_path) as archive:
+            return archive['grid']
+    if fmt == 'raw':
+        with open(sidecar_path(in_path)) as f:
+            meta = json.load(f)
+        return np.fromfile(in_path, dtype=meta['dtype']).reshape(-1, len(column_names(meta)))
+    import pyarrow.parquet as pq
+    table = pq.read_table(in_path)
+    return np.column_stack([table.column(name).to_numpy() for name in table.column_names if name != 'geometry'])
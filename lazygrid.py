@@ -0,0 +1,173 @@
+"""
+NAME:           lazygrid.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Implicit regularly spaced grid described only by its SW origin, spacing and node counts. Nodes are
+computed on demand, so len(), slicing, fancy indexing, block iteration and coordinate <-> index conversion cost
+nothing up front and only as much memory as the nodes actually requested. Node order matches pocketgrid.grid
+(column-major: northings vary fastest within each easting).
+
+TO RUN:
+    -   Call pocketgrid.lazy_grid() with the same inputs as pocketgrid.grid(), or build one directly:
+          -  LazyGrid(origin, spacing, shape) - origin (x, y), spacing in CRS units, shape (columns, rows)
+          -  LazyGrid.from_corners(sw, ne, spacing) - same lattice pocketgrid.grid generates between two corners
+
+DATA FORMAT:    Returns (n, 2) numpy arrays of easting,northing
+
+REQUIRES:       numpy, gridengine
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import numpy as np
+import gridengine
+
+
+class LazyGrid:
+    def __init__(self, origin, spacing, shape, epsg=None, dtype=np.float64, order='column'):
+        if order not in ('column', 'row'):
+            raise ValueError(f"order must be 'column' or 'row', not {order!r}")
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.spacing = spacing
+        self.columns, self.rows = int(shape[0]), int(shape[1])
+        self.epsg = epsg
+        self.dtype = np.dtype(dtype)
+        self.order = order
+
+    @classmethod
+    def from_corners(cls, sw, ne, spacing, epsg=None, dtype=np.float64, order='column'):
+        return cls(sw, spacing, gridengine.shape(sw, ne, spacing), epsg=epsg, dtype=dtype, order=order)
+
+    def __len__(self):
+        return self.columns * self.rows
+
+    def __repr__(self):
+        return (f"LazyGrid(origin={self.origin}, spacing={self.spacing}, shape=({self.columns}, {self.rows}), "
+                f"epsg={self.epsg})")
+
+    @property
+    def shape(self):
+        return len(self), 2
+
+    @property
+    def meta(self):
+        # Grid description used by gridwriters (and the raw output sidecar)
+        return {'epsg': self.epsg, 'origin': list(self.origin), 'spacing': self.spacing,
+                'shape': [self.columns, self.rows], 'count': len(self), 'order': self.order}
+
+    # region Index <-> coordinate conversion
+    def _split(self, index):
+        # Node index -> (column, row) lattice indices
+        if self.order == 'column':
+            return np.divmod(index, self.rows)
+        row, column = np.divmod(index, self.columns)
+        return column, row
+
+    def _join(self, column, row):
+        return column * self.rows + row if self.order == 'column' else row * self.columns + column
+
+    def coords(self, index):
+        # Easting,northing of node index (scalar or array); negative indices count from the end
+        index = np.asarray(index, dtype=np.int64)
+        index = np.where(index < 0, index + len(self), index)
+        if np.any((index < 0) | (index >= len(self))):
+            raise IndexError(f"grid node index out of range for a grid of {len(self)} nodes")
+        column, row = self._split(index)
+        out = np.empty(index.shape + (2,), dtype=self.dtype)
+        out[..., 0] = self.origin[0] + column * self.spacing
+        out[..., 1] = self.origin[1] + row * self.spacing
+        return out
+
+    def lattice_index(self, x, y):
+        # Nearest (column, row) for coordinates; -1 where the point falls outside half a spacing of the grid
+        column = np.rint((np.asarray(x, dtype=np.float64) - self.origin[0]) / self.spacing).astype(np.int64)
+        row = np.rint((np.asarray(y, dtype=np.float64) - self.origin[1]) / self.spacing).astype(np.int64)
+        outside = (column < 0) | (column >= self.columns) | (row < 0) | (row >= self.rows)
+        return np.where(outside, -1, column), np.where(outside, -1, row)
+
+    def index(self, x, y):
+        # Nearest node index for coordinates in O(1) per point; -1 where the point is off the grid
+        column, row = self.lattice_index(x, y)
+        return np.where(column < 0, -1, self._join(column, row))
+
+    def nearest(self, x, y):
+        # (node index, distance) of the nearest node to each point; points off the grid snap to the nearest edge node.
+        # An empty grid has no nearest node: -1 at an infinite distance.
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        if len(self) == 0:
+            shape = np.broadcast(x, y).shape
+            return np.full(shape, -1, dtype=np.int64)[()], np.full(shape, np.inf)[()]  # [()]: scalars for scalar input
+        column = np.clip(np.rint((x - self.origin[0]) / self.spacing), 0, max(self.columns - 1, 0)).astype(np.int64)
+        row = np.clip(np.rint((y - self.origin[1]) / self.spacing), 0, max(self.rows - 1, 0)).astype(np.int64)
+        distance = np.hypot(x - (self.origin[0] + column * self.spacing), y - (self.origin[1] + row * self.spacing))
+        return self._join(column, row), distance
+
+    def cell_index(self, x, y):
+        # Index of the grid cell (the square between four neighbouring nodes) containing each point, numbered in the
+        # same order as the nodes over the (columns - 1, rows - 1) cell lattice; -1 outside the grid
+        u = (np.asarray(x, dtype=np.float64) - self.origin[0]) / self.spacing
+        v = (np.asarray(y, dtype=np.float64) - self.origin[1]) / self.spacing
+        columns, rows = self.columns - 1, self.rows - 1
+        outside = ~((u >= 0) & (u <= columns) & (v >= 0) & (v <= rows)) | (columns < 1) | (rows < 1)
+        # Points on the far edges belong to the last cell rather than to one past the end
+        column = np.minimum(np.floor(np.where(outside, 0, u)), columns - 1).astype(np.int64)
+        row = np.minimum(np.floor(np.where(outside, 0, v)), rows - 1).astype(np.int64)
+        cell = column * rows + row if self.order == 'column' else row * columns + column
+        return np.where(outside, -1, cell)
+
+    # endregion
+
+    # region Array access
+    def __getitem__(self, key):
+        if isinstance(key, tuple):  # grid[nodes, axis] as on the materialised array
+            return self[key[0]][(Ellipsis,) + key[1:]]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            return self.coords(np.arange(start, stop, step, dtype=np.int64))
+        key = np.asarray(key)
+        if key.dtype == np.bool_:
+            if key.shape != (len(self),):
+                raise IndexError(f"boolean index must have shape ({len(self)},), not {key.shape}")
+            key = np.flatnonzero(key)
+        elif not np.issubdtype(key.dtype, np.integer):
+            raise IndexError("grid nodes can only be indexed with integers, slices or boolean masks")
+        return self.coords(key)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.to_numpy() if dtype is None else self.to_numpy().astype(dtype, copy=False)
+
+    def __iter__(self):
+        for block in self.iter_blocks():
+            yield from block
+
+    def iter_blocks(self, nodes=1 << 16, dtype=None):
+        # Yields consecutive blocks of whole columns (rows in row order) holding about `nodes` grid nodes each
+        xs, ys = self.axes()
+        dtype = self.dtype if dtype is None else dtype
+        if self.order == 'column':
+            step = max(1, nodes // max(1, self.rows))
+            for start in range(0, self.columns, step):
+                yield gridengine.lattice_from_axes(xs[start:start + step], ys, dtype=dtype)
+        else:
+            step = max(1, nodes // max(1, self.columns))
+            for start in range(0, self.rows, step):
+                yield gridengine.lattice_from_axes(xs, ys[start:start + step], dtype=dtype, order='row')
+
+    def axes(self):
+        # Easting and northing axis vectors, identical to gridengine.axis for the same lattice
+        xs = self.origin[0] + np.arange(self.columns, dtype=np.float64) * self.spacing
+        ys = self.origin[1] + np.arange(self.rows, dtype=np.float64) * self.spacing
+        return xs, ys
+
+    def to_numpy(self):
+        return gridengine.lattice_from_axes(*self.axes(), dtype=self.dtype, order=self.order)
+
+    # endregion
@@ -6,12 +6,20 @@ COMPATIBILITY:  Python 3.10
 DESCRIPTION:    This program allows the user to draw a bounding box polygon using a mapping interface and
                 and generate a .geojson file for input into the geojsonintake.py function
 
+                The precomputed bounding box guides are read from a local layer cache, so the map opens without
+                a download and works on hosts with no internet access. The cached layer is simplified to a
+                tolerance suited to the map's zoom levels and stored as ready-made GeoJSON, which keeps
+                mapper.html small. The cache is only rebuilt when asked (refresh), from GitHub or a local copy.
+
 TO RUN:
     -   No special instructions
+    -   mapper(preview=grid, preview_epsg=26915) overlays a density raster and a node sample of a generated grid
+    -   Build or refresh the layer cache: python mapper.py --refresh [--no-map] [--source gridbb_formatted_wgs84.zip]
 
-DATA FORMAT:    Standalone script
+DATA FORMAT:    Standalone script; cached layer is <LAYER_DIR>/gridbb_<tolerance>.geojson
 
-REQUIRES:       os, folium, geopandas, webbrowser
+REQUIRES:       argparse, json, os, sys, pathlib, webbrowser, folium, geopandas (layer refresh only),
+                gridpreview (grid preview only)
 
 TODO:           N/A
 
@@ -22,18 +30,62 @@ ORGANIZATION:   The Water Institute of The Gulf
 CONTACT:        hbienn@thewaterinstitute.org
 """
 
+import argparse
+import json
 import os
-import folium
-from folium import plugins, features
-import geopandas as gpd
+import sys
 import webbrowser
-
-
-def mapper():
-    # Import bounding box guides
-    url = "https://github.com/hbienn/FoliumMapper/blob/main/precomputedbb/"
-    gridbb_formatted = f"{url}/gridbb_formatted_wgs84.zip?raw=true"
-    gridbb = gpd.read_file(gridbb_formatted)
+from pathlib import Path
+
+BB_URL = "https://github.com/hbienn/FoliumMapper/blob/main/precomputedbb/gridbb_formatted_wgs84.zip?raw=true"
+LAYER_DIR = os.path.join(Path.home(), ".gridcache", "mapper")
+LAYER_TOLERANCE = 0.001  # Degrees (~100 m), below a pixel at the zoom levels the guides are used at
+LAYER_DECIMALS = 5  # Coordinate decimals kept in the cached GeoJSON (~1 m)
+
+
+def layer_path(tolerance=LAYER_TOLERANCE, layer_dir=LAYER_DIR):
+    return os.path.join(str(layer_dir), f"gridbb_{tolerance:g}.geojson")
+
+
+def build_layer(source=BB_URL, tolerance=LAYER_TOLERANCE, layer_dir=LAYER_DIR):
+    # Reads the bounding box guides (URL or local file), simplifies and rounds them and stores the GeoJSON text
+    import geopandas as gpd
+    import numpy as np
+    import shapely
+    gridbb = gpd.read_file(source).to_crs(4326)
+    geometry = gridbb.geometry.simplify(tolerance, preserve_topology=True)
+    gridbb.geometry = shapely.transform(geometry.values, lambda coords: np.round(coords, LAYER_DECIMALS))
+    path = layer_path(tolerance, layer_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part = f"{path}.{os.getpid()}.part"
+    with open(part, 'w') as of:
+        of.write(gridbb.to_json(drop_id=True))
+    os.replace(part, path)  # An interrupted refresh never leaves a broken layer behind
+    return path
+
+
+def load_layer(refresh=False, source=BB_URL, tolerance=LAYER_TOLERANCE, layer_dir=LAYER_DIR):
+    # GeoJSON dict of the cached guides, built on first use or when refresh is set; None if it cannot be built
+    path = layer_path(tolerance, layer_dir)
+    if refresh or not os.path.exists(path):
+        try:
+            build_layer(source, tolerance, layer_dir)
+        except Exception as error:  # Offline with no cached layer yet; a stale cached layer is still used
+            print(f"Bounding box guides could not be loaded from {source}: {error}")
+            if not os.path.exists(path):
+                return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def mapper(refresh_layer=False, layer_source=BB_URL, preview=None, preview_epsg=None):
+    # preview - optional grid (pocketgrid.grid array with preview_epsg, LazyGrid, ClippedGrid...) drawn over the map
+    # Mapping libraries are only loaded when the map is actually opened
+    import folium
+    from folium import plugins, features
+
+    # Import bounding box guides from the local layer cache
+    gridbb = load_layer(refresh_layer, layer_source)
 
     # Create a map object with coordinates centered on Baton Rouge, LA.
     m = folium.Map(location=[30.432555, -91.192306],
@@ -97,32 +149,52 @@ def mapper():
                                   )
 
     # Force vector style manipulations
-    folium.GeoJson(gridbb,
-                   highlight_function=lambda feature: {
-                       "stroke": True,
-                       "color": '#006EFF',
-                       "weight": 3,
-                       "fill": True,
-                       "fillColor": '#B39200',
-                       "FillOpacity": 1,
-                   },
-                   style_function=lambda feature: {
-                       "stroke": True,
-                       "color": '#ffcf01',
-                       "weight": 3,
-                       "fill": True,
-                       "fillColor": '#004CA8',
-                       "FillOpacity": 0.5,
-                   },
-                   zoom_on_click=True,
-                   popup=popup,
-                   tooltip=tooltip,
-                   ).add_to(m)
+    if gridbb is not None:
+        folium.GeoJson(gridbb,
+                       highlight_function=lambda feature: {
+                           "stroke": True,
+                           "color": '#006EFF',
+                           "weight": 3,
+                           "fill": True,
+                           "fillColor": '#B39200',
+                           "FillOpacity": 1,
+                       },
+                       style_function=lambda feature: {
+                           "stroke": True,
+                           "color": '#ffcf01',
+                           "weight": 3,
+                           "fill": True,
+                           "fillColor": '#004CA8',
+                           "FillOpacity": 0.5,
+                       },
+                       zoom_on_click=True,
+                       popup=popup,
+                       tooltip=tooltip,
+                       ).add_to(m)
+
+    # Overlay a bounded-size preview of a generated grid (see gridpreview.py)
+    if preview is not None:
+        import gridpreview
+        gridpreview.add_preview(m, preview, epsg=preview_epsg)
+        folium.LayerControl().add_to(m)
 
     # Display the map
     m.save("mapper.html")
     webbrowser.open_new_tab("file://" + os.path.realpath("mapper.html"))
 
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Draw a bounding box on an interactive map")
+    parser.add_argument('--refresh', action='store_true', help="rebuild the cached bounding box guides")
+    parser.add_argument('--source', default=BB_URL, help="URL or local file of the bounding box guides")
+    parser.add_argument('--no-map', action='store_true', help="only refresh the cache, do not open the map")
+    args = parser.parse_args(argv)
+    if args.no_map:
+        print(f"Bounding box guides cached at {build_layer(args.source)}")
+        return 0
+    mapper(args.refresh, args.source)
+    return 0
+
+
 if __name__ == "__main__":
-    mapper()
+    sys.exit(main())
@@ -11,19 +11,48 @@ TO RUN:
         Keep it in the downloads directory on your local drive.
     -   Modify function values as desired. Default variable assignments:
           -  in_path - attempts to locate "boundingbox.geojson" in your downloads folder
-          -  out_path - saves "grid.csv" to your documents folder
+                (only its first feature is read, and for GeoJSON only its bounds unless clipping; see gridinput.py)
+          -  out_path - saves "grid.csv" to your documents folder. The extension selects the output format
+                (see gridwriters.py): .csv/.txt, .csv.gz/.csv.xz (compressed in parallel blocks), .npy (memory-mapped,
+                the memmap is returned so the grid never has to fit in memory), .npz, raw .f32/.f64 with a .json
+                sidecar, or .parquet (GeoParquet)
           -  in_epsg = 4326 - EPSG id for WGS84 geographic coordinate system with units in degrees
                 (https://epsg.io/4326)
           -  out_epsg = 26915 - EPSG id for NAD83 UTM 15N projected coordinate system with units in meters
                 (https://epsg.io/26915)
           -  grid_spacing = 500 - assigned as the default grid spacing in meters
+          -  dtype = np.float64 - precision of the returned array (np.float32 halves memory)
+          -  as_points = False - set True to return shapely Points instead of the easting,northing array
+          -  precision = 6 - decimal places written to the plaintext output
+          -  out_format = None - output format name overriding the out_path extension
+          -  clip = False - set True to keep only the nodes inside the input polygon (holes excluded) rather than its
+                whole bounding box
+          -  extra_epsg = None - EPSG id whose coordinates are appended as two more columns for every node (4326
+                adds lon,lat), reprojected in chunks on a pool of `threads` threads (see reproject.py)
+          -  cache = None - True (or a gridcache.GridCache) to reuse grids already generated from the same geometry
+                and parameters; a hit returns a read-only memmap from the cache (see gridcache.py)
+          -  stats = None - a gridstats.GridStats to fill with per-stage time, nodes, bytes written and peak memory;
+                its callback (if any) is called after every stage and block for progress display
+    -   For grids too large to hold in memory use iter_grid, which yields block_size columns (order='column',
+        same node order as grid) or rows (order='row') at a time as numpy arrays
+    -   lazy_grid returns a LazyGrid (see lazygrid.py) computing nodes on demand from origin, spacing and shape, for
+        callers that only need the node count, a few rows or coordinate <-> index conversion
+    -   write_grid writes the output without building the grid in memory and returns (source, written); used by
+        gridcli.py for unattended runs
+    -   grid_pyramid writes several spacings (e.g. 500, 250, 125, 62.5) aligned to one origin in a single call, with
+        arrays mapping each fine node to its parent coarse node
+    -   adaptive_grid refines a coarse lattice quadtree-style near the polygon boundary (or a line layer) down to
+        min_spacing and writes an extra level column
+    -   tile_grid writes one shard of the grid as fixed tiles for splitting a very large domain across machines;
+        tiling.merge stitches the shards back into the single-run output
     -   Run the code
 
 DATA FORMAT:    Manual input
 
-REQUIRES:       os, pathlib, geopandas, pyproj, shapely, numpy
+REQUIRES:       os, pathlib, geopandas, numpy, projcache (pyproj), gridengine, gridwriters, lazygrid, polyclip, shapely,
+                reproject, tiling, gridcache, pyramid, quadtree, gridstats, gridinput
 
-TODO:           1) implement polygon generation
+TODO:           N/A
 
 AUTHOR:         Harris Bienn
 
@@ -35,47 +64,271 @@ CONTACT:        hbienn@thewaterinstitute.org
 
 import os
 from pathlib import Path
-import geopandas as gpd
-from pyproj import CRS, Transformer
-import shapely.geometry as geo
 import numpy as np
+import gridcache
+import gridengine
+import gridinput
+import gridstats
+import gridwriters
+import projcache
+import pyramid
+import quadtree
+import reproject
+import tiling
+from lazygrid import LazyGrid
+from polyclip import ClippedGrid
+
+
+def _read(in_path, in_epsg, out_epsg, stats=None):
+    with gridstats.stage(stats, 'read'):
+        feature = gridinput.InputFeature(in_path)  # First feature only; its geometry is read when clipping needs it
+        minx, miny, maxx, maxy = feature.bounds  # Bounding box without building a GeoDataFrame (see gridinput.py)
+    with gridstats.stage(stats, 'crs'):
+        transformer = projcache.get_transformer(in_epsg, out_epsg)  # Define transformer, reused across calls
+    with gridstats.stage(stats, 'corners'):
+        transformed_sw = transformer.transform(minx, miny)  # Transforms SW corner point to target CRS
+        transformed_ne = transformer.transform(maxx, maxy)  # Transforms NE corner point to target CRS
+    return feature, transformer, transformed_sw, transformed_ne
+
+
+def _corners(in_path, in_epsg, out_epsg):
+    return _read(in_path, in_epsg, out_epsg)[2:]
+
+
+def _footprint(feature, transformer):
+    # Polygon of the first feature (the one whose bounds define the grid) reprojected to the target CRS
+    import shapely
+    return shapely.transform(feature.geometry, transformer.transform, interleaved=False)
+
+
+def grid_source(in_path=str(os.path.join(Path.home(), "Downloads") + "\\boundingbox.geojson"),
+                in_epsg=4326,
+                out_epsg=26915,
+                grid_spacing=500,
+                dtype=np.float64,
+                clip=False,
+                stats=None):
+    # LazyGrid (or ClippedGrid with clip=True) for the input bounds, ready to be written or materialised
+    return _source(*_read(in_path, in_epsg, out_epsg, stats), out_epsg, grid_spacing, dtype, clip)
+
+
+def _source(feature, transformer, transformed_sw, transformed_ne, out_epsg, grid_spacing, dtype, clip):
+    lazy = LazyGrid.from_corners(transformed_sw, transformed_ne, int(grid_spacing), epsg=out_epsg, dtype=dtype)
+    if clip:  # Keep only the nodes inside the polygon itself
+        return ClippedGrid(lazy, _footprint(feature, transformer))
+    return lazy
+
+
+def _blocks(source, extra_epsg=None, threads=None):
+    blocks, meta = source.iter_blocks(dtype=np.float64), source.meta  # Writers cast to dtype; CSV stays exact
+    if extra_epsg is not None:  # Append the nodes reprojected to a second CRS as two more columns
+        blocks, meta = reproject.add_columns(blocks, meta, extra_epsg, workers=threads)
+    return blocks, meta
+
+
+def write_grid(in_path=str(os.path.join(Path.home(), "Downloads") + "\\boundingbox.geojson"),
+               out_path=str(os.path.join(Path.home(), "Documents") + "\\grid.csv"),
+               in_epsg=4326,
+               out_epsg=26915,
+               grid_spacing=500,
+               dtype=np.float64,
+               precision=6,
+               out_format=None,
+               clip=False,
+               extra_epsg=None,
+               threads=None,
+               stats=None):
+    # Writes the grid without materialising it; returns the grid source and whatever the writer returned
+    out_format = gridwriters.output_format(out_path, out_format)  # Fail on an unknown format before any work
+    source = grid_source(in_path, in_epsg, out_epsg, grid_spacing, dtype=dtype, clip=clip, stats=stats)
+    blocks, meta = _blocks(source, extra_epsg, threads)
+    written = _write(out_path, blocks, meta, out_format, dtype, precision, stats, threads)
+    return source, written
+
+
+def _keep(blocks, kept):
+    for block in blocks:
+        kept.append(block)
+        yield block
+
+
+def _write(out_path, blocks, meta, out_format, dtype, precision, stats=None, threads=None):
+    # threads also sizes the compression pool of .csv.gz / .csv.xz output
+    if stats is None:
+        return gridwriters.write(out_path, blocks, meta, fmt=out_format, dtype=dtype, precision=precision,
+                                 threads=threads)
+    stats.start_progress(meta['count'])
+    with stats.stage('write', nodes=meta['count']) as stage:  # Time spent producing blocks goes to 'generate'
+        written = gridwriters.write(out_path, stats.track(blocks), meta, fmt=out_format, dtype=dtype,
+                                    precision=precision, generated=stats.track_chunks, threads=threads)
+        stage.bytes = gridstats.output_bytes(out_path)
+    return written
 
 
 def grid(in_path=str(os.path.join(Path.home(), "Downloads") + "\\boundingbox.geojson"),
          out_path=str(os.path.join(Path.home(), "Documents") + "\\grid.csv"),
          in_epsg=4326,
          out_epsg=26915,
-         grid_spacing=500):
-    gdf = gpd.read_file(in_path)  # Read GeoJSON into GeoDataFrame and make copy for geometry conversion
-    in_proj = CRS.from_user_input(in_epsg)  # Define input coordinate system
-    out_proj = CRS.from_user_input(out_epsg)  # Define output coordinate system
-    bounds = np.array(gdf.bounds)  # Returns tuple minx, miny, maxx, maxy of bounding box
-    sw = geo.Point((bounds[0, 0], bounds[0, 1]))  # Detail SW corner and convert to shapely point geometry
-    ne = geo.Point((bounds[0, 2], bounds[0, 3]))  # Detail NE corner and convert to shapely point geometry
-    transformer = Transformer.from_crs(in_proj, out_proj, always_xy=True)  # Define transformer
-    transformed_sw = transformer.transform(sw.x, sw.y)  # Transforms SW corner point to target CRS
-    transformed_ne = transformer.transform(ne.x, ne.y)  # Transforms SE corner point to target CRS
-    grid_points = []
-    list_array = []
-    x = transformed_sw[0]
-    while x < transformed_ne[0]:
-        y = transformed_sw[1]
-        while y < transformed_ne[1]:
-            p = geo.Point(x, y)
-            grid_points.append(p)
-            y += int(grid_spacing)
-        x += int(grid_spacing)
-        for pp in grid_points:
-            list_array.append([pp.x, pp.y])
-    with open(out_path, 'w') as of:  # Create plaintext output
-        of.write('easting,northing\n')
-        for points in grid_points:
-            of.write('{:f},{:f}\n'.format(points.x, points.y))
-    grid_nparray = np.array(list_array)  # Create numpy array output
+         grid_spacing=500,
+         dtype=np.float64,
+         as_points=False,
+         precision=6,
+         out_format=None,
+         clip=False,
+         extra_epsg=None,
+         threads=None,
+         cache=None,
+         stats=None):
+    if cache:
+        grid_nparray = _cached_grid(cache, in_path, out_path, in_epsg, out_epsg, grid_spacing, dtype, precision,
+                                    out_format, clip, extra_epsg, threads, stats)
+        return gridengine.to_points(grid_nparray[:, :2]) if as_points else grid_nparray
+    out_format = gridwriters.output_format(out_path, out_format)
+    source = grid_source(in_path, in_epsg, out_epsg, grid_spacing, dtype=dtype, clip=clip, stats=stats)
+    blocks, meta = _blocks(source, extra_epsg, threads)
+    kept = [] if extra_epsg is not None and out_format != 'npy' else None
+    if kept is not None:  # Keep the reprojected blocks as they are written rather than reprojecting twice
+        blocks = _keep(blocks, kept)
+    written = _write(out_path, blocks, meta, out_format, dtype, precision, stats, threads)
+    if out_format == 'npy':
+        grid_nparray = written  # Memory-mapped output, not an in-memory copy
+    else:
+        with gridstats.stage(stats, 'array', nodes=len(source)):
+            if kept is None:
+                grid_nparray = source.to_numpy()  # Create numpy array output
+            else:
+                grid_nparray = np.concatenate(kept).astype(dtype, copy=False) if kept else np.empty((0, 4), dtype)
+    if as_points:
+        return gridengine.to_points(grid_nparray[:, :2])  # Shapely points only when the caller asks for them
     return grid_nparray
 
 
-grid_nparray = grid()
+def _cached_grid(cache, in_path, out_path, in_epsg, out_epsg, grid_spacing, dtype, precision, out_format, clip,
+                 extra_epsg, threads, stats=None):
+    # grid() through a gridcache.GridCache (cache=True for the default one). A miss streams the grid into the cache;
+    # either way the output is written from the cached memmap, so hits and misses write identical files.
+    out_format = gridwriters.output_format(out_path, out_format)
+    cache = gridcache.default_cache() if cache is True else cache
+    read = _read(in_path, in_epsg, out_epsg, stats)
+    with gridstats.stage(stats, 'cache'):
+        name = gridcache.key(read[0].geometry, in_epsg=in_epsg, out_epsg=out_epsg,
+                             grid_spacing=int(grid_spacing), clip=bool(clip), extra_epsg=extra_epsg)
+        entry = cache.get(name)
+        if entry is None:
+            entry = cache.put(name, *_blocks(_source(*read, out_epsg, grid_spacing, dtype, clip), extra_epsg, threads))
+    cached, meta = entry
+    step = gridwriters.CSV_CHUNK_ROWS
+    chunks = (cached[start:start + step] for start in range(0, len(cached), step))
+    written = _write(out_path, chunks, meta, out_format, dtype, precision, stats, threads)
+    if out_format == 'npy':
+        return written
+    return cached if np.dtype(dtype) == np.float64 else cached.astype(dtype)  # The cache always holds float64
+
+
+def tile_grid(in_path=str(os.path.join(Path.home(), "Downloads") + "\\boundingbox.geojson"),
+              out_path=str(os.path.join(Path.home(), "Documents") + "\\grid.csv"),
+              in_epsg=4326,
+              out_epsg=26915,
+              grid_spacing=500,
+              dtype=np.float64,
+              precision=6,
+              out_format=None,
+              clip=False,
+              extra_epsg=None,
+              threads=None,
+              tile_nodes=tiling.TILE_NODES,
+              shard=0,
+              shards=1):
+    # Writes shard `shard` of `shards` of the grid as fixed tiles plus an index file; returns the index (see tiling.py)
+    feature, transformer, transformed_sw, transformed_ne = _read(in_path, in_epsg, out_epsg)
+    lazy = LazyGrid.from_corners(transformed_sw, transformed_ne, int(grid_spacing), epsg=out_epsg, dtype=dtype)
+    polygon = _footprint(feature, transformer) if clip else None
+    return tiling.write_tiles(lazy, out_path, tile_nodes, shard, shards, polygon=polygon, fmt=out_format, dtype=dtype,
+                              precision=precision, extra_epsg=extra_epsg, threads=threads)
+
+
+def grid_pyramid(in_path=str(os.path.join(Path.home(), "Downloads") + "\\boundingbox.geojson"),
+                 out_path=str(os.path.join(Path.home(), "Documents") + "\\grid.csv"),
+                 in_epsg=4326,
+                 out_epsg=26915,
+                 spacings=(500, 250, 125, 62.5),
+                 dtype=np.float64,
+                 precision=6,
+                 out_format=None,
+                 clip=False):
+    # One level per spacing aligned to a common origin, read and transformed once; writes each level, the fine ->
+    # coarse parent arrays and an index (see pyramid.py). Returns the level entries with their grid and parent array.
+    feature, transformer, transformed_sw, transformed_ne = _read(in_path, in_epsg, out_epsg)
+    grids = pyramid.levels(transformed_sw, transformed_ne, spacings, epsg=out_epsg, dtype=dtype)
+    if clip:
+        footprint = _footprint(feature, transformer)
+        grids = [ClippedGrid(level, footprint) for level in grids]
+    entries = pyramid.write_pyramid(grids, out_path, fmt=out_format, dtype=dtype, precision=precision)
+    folder = os.path.dirname(os.path.abspath(out_path))
+    for entry, level in zip(entries, grids):
+        entry['grid'] = level
+        entry['parent'] = None if entry['parent'] is None else np.load(os.path.join(folder, entry['parent']),
+                                                                       mmap_mode='r')
+    return entries
+
+
+def adaptive_grid(in_path=str(os.path.join(Path.home(), "Downloads") + "\\boundingbox.geojson"),
+                  out_path=str(os.path.join(Path.home(), "Documents") + "\\grid.csv"),
+                  in_epsg=4326,
+                  out_epsg=26915,
+                  grid_spacing=500,
+                  min_spacing=62.5,
+                  refine_near=None,
+                  buffer=0.0,
+                  dtype=np.float64,
+                  precision=6,
+                  out_format=None,
+                  clip=False):
+    # Coarse lattice refined quadtree-style near the polygon boundary (or the lines of the refine_near GeoJSON, in
+    # in_epsg) down to min_spacing; returns the (n, 3) easting,northing,level array (see quadtree.py)
+    import shapely
+    feature, transformer, transformed_sw, transformed_ne = _read(in_path, in_epsg, out_epsg)
+    lazy = LazyGrid.from_corners(transformed_sw, transformed_ne, int(grid_spacing), epsg=out_epsg, dtype=dtype)
+    footprint = _footprint(feature, transformer)
+    if refine_near is None:
+        edges = footprint
+    else:
+        import geopandas as gpd
+        lines = gpd.read_file(refine_near).geometry.values
+        edges = shapely.GeometryCollection(list(shapely.transform(lines, transformer.transform, interleaved=False)))
+    source = quadtree.QuadtreeGrid(lazy, edges, min_spacing, buffer=buffer, polygon=footprint if clip else None)
+    written = gridwriters.write(out_path, source.iter_blocks(dtype=np.float64), source.meta, fmt=out_format,
+                                dtype=dtype, precision=precision)
+    return written if gridwriters.output_format(out_path, out_format) == 'npy' else source.to_numpy()
+
+
+def lazy_grid(in_path=str(os.path.join(Path.home(), "Downloads") + "\\boundingbox.geojson"),
+              in_epsg=4326,
+              out_epsg=26915,
+              grid_spacing=500,
+              dtype=np.float64):
+    # Implicit grid: node count, slices and coordinate <-> index lookups without building or writing the grid
+    transformed_sw, transformed_ne = _corners(in_path, in_epsg, out_epsg)
+    return LazyGrid.from_corners(transformed_sw, transformed_ne, int(grid_spacing), epsg=out_epsg, dtype=dtype)
+
+
+def iter_grid(in_path=str(os.path.join(Path.home(), "Downloads") + "\\boundingbox.geojson"),
+              in_epsg=4326,
+              out_epsg=26915,
+              grid_spacing=500,
+              block_size=256,
+              order='column',
+              dtype=np.float64,
+              clip=False):
+    # Generator companion to grid(): yields easting,northing blocks of block_size columns (or rows) at a time
+    feature, transformer, transformed_sw, transformed_ne = _read(in_path, in_epsg, out_epsg)
+    if clip:  # Clipped blocks hold at most as many nodes as block_size whole lines would
+        lazy = LazyGrid.from_corners(transformed_sw, transformed_ne, int(grid_spacing), dtype=dtype, order=order)
+        line_nodes = lazy.rows if order == 'column' else lazy.columns
+        yield from ClippedGrid(lazy, _footprint(feature, transformer)).iter_blocks(nodes=block_size * line_nodes)
+        return
+    yield from gridengine.iter_blocks(transformed_sw, transformed_ne, int(grid_spacing),
+                                      block_size=block_size, dtype=dtype, order=order)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,163 @@
+"""
+NAME:           polyclip.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Clips a regularly spaced grid to a polygon (holes and multipolygons included) by scanline span filling.
+Each lattice line is intersected with the polygon edges to get the inside spans, and the nodes in those spans are
+emitted directly, so no point-in-polygon test is run per node and the cost scales with lines x edges plus the
+number of nodes kept. Scanlines run along the outer loop of the grid order (lattice columns for pocketgrid's
+column-major order) so clipped nodes come out in the same order as the unclipped grid. Nodes on the boundary are kept
+(as shapely.intersects_xy would); the few scanlines running through a polygon vertex, where the even-odd rule is
+ambiguous, are intersected with the polygon exactly.
+
+TO RUN:
+    -   Call pocketgrid.grid(..., clip=True), or build one directly:
+          -  ClippedGrid(lazy, polygon) - lazy is a lazygrid.LazyGrid, polygon a shapely geometry in the same CRS
+
+DATA FORMAT:    Returns (n, 2) numpy arrays of easting,northing
+
+REQUIRES:       numpy, shapely, lazygrid
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import numpy as np
+
+SCAN_CELLS = 1 << 22  # Scanlines x edges evaluated per chunk; bounds the scratch memory of span finding
+
+
+def ring_segments(polygon):
+    # (n, 4) array of x0, y0, x1, y1 for every edge of every exterior and interior ring
+    import shapely
+    rings = shapely.get_rings(shapely.get_parts(polygon))
+    coords, ring = shapely.get_coordinates(rings, return_index=True)
+    same_ring = ring[1:] == ring[:-1]
+    return np.column_stack((coords[:-1][same_ring], coords[1:][same_ring]))
+
+
+def _line_spans(segments, lines):
+    # Even-odd spans along each scanline value in lines. Segments are (a0, b0, a1, b1) with a the scan axis.
+    # Returns (line, lo, hi) arrays of the span coordinates, sorted by line then lo.
+    a0, b0, a1, b1 = segments.T
+    lower, upper = np.minimum(a0, a1), np.maximum(a0, a1)
+    crossing = (lower <= lines[:, None]) & (lines[:, None] < upper)  # Half-open so shared vertices count once
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hits = b0 + (lines[:, None] - a0) * ((b1 - b0) / (a1 - a0))
+    hits = np.sort(np.where(crossing, hits, np.inf), axis=1)
+    pairs = crossing.sum(axis=1) // 2
+    width = int(pairs.max(initial=0))
+    valid = np.arange(width) < pairs[:, None]
+    line = np.broadcast_to(np.arange(lines.size)[:, None], valid.shape)[valid]
+    return line, hits[:, 0:2 * width:2][valid], hits[:, 1:2 * width:2][valid]
+
+
+def _vertex_line_spans(polygon, line, along, column_order):
+    # (lo, hi) of the closed spans of one scanline that passes through a polygon vertex, from the exact intersection
+    # (edges lying along the line and single touching points included, as shapely.intersects_xy would)
+    import shapely
+    ends = [(line, along[0]), (line, along[-1])] if column_order else [(along[0], line), (along[-1], line)]
+    parts = shapely.get_parts(shapely.intersection(polygon, shapely.LineString(ends)))
+    parts = parts[~shapely.is_empty(parts)]
+    if parts.size == 0:
+        return np.empty(0), np.empty(0)
+    bounds = shapely.bounds(parts)
+    axis = 1 if column_order else 0
+    return bounds[:, axis], bounds[:, axis + 2]
+
+
+class ClippedGrid:
+    def __init__(self, lazy, polygon):
+        self.lazy = lazy
+        self.polygon = polygon
+        segments = ring_segments(polygon)
+        if lazy.order == 'column':  # Scan lattice columns (x = const), spans run along y
+            self._segments = segments
+        else:  # Scan lattice rows (y = const), spans run along x
+            self._segments = segments[:, [1, 0, 3, 2]]
+        self._count = None
+
+    def _scan_axes(self):
+        xs, ys = self.lazy.axes()
+        return (xs, ys) if self.lazy.order == 'column' else (ys, xs)
+
+    def spans(self):
+        # Yields (line, first, last) lattice index arrays: nodes first..last (inclusive) of each line are inside
+        lines, along = self._scan_axes()
+        if lines.size == 0 or along.size == 0:
+            return
+        lower = np.minimum(self._segments[:, 0], self._segments[:, 2])
+        upper = np.maximum(self._segments[:, 0], self._segments[:, 2])
+        vertex = np.isin(lines, self._segments[:, [0, 2]])  # Lines through a vertex, recomputed exactly
+        step = max(1, SCAN_CELLS // max(1, len(self._segments)))
+        for start in range(0, lines.size, step):
+            chunk = lines[start:start + step]
+            near = (upper > chunk[0]) & (lower <= chunk[-1])  # Only edges that reach this band of lines
+            line, lo, hi = _line_spans(self._segments[near], chunk)
+            if vertex[start:start + step].any():
+                line, lo, hi = self._vertex_lines(chunk, vertex[start:start + step], line, lo, hi, along)
+            first = np.maximum(np.ceil((lo - along[0]) / self.lazy.spacing), 0).astype(np.int64)
+            last = np.minimum(np.floor((hi - along[0]) / self.lazy.spacing), along.size - 1).astype(np.int64)
+            # Spans of touching parts can share an end node; start each span after the furthest node already emitted
+            # on its line (offsetting by line keeps the running maximum within the line)
+            reach = np.maximum.accumulate(last + line * (along.size + 1)) - line * (along.size + 1)
+            previous = np.concatenate(([-1], reach[:-1]))
+            first = np.where(np.concatenate(([False], line[1:] == line[:-1])), np.maximum(first, previous + 1), first)
+            keep = first <= last
+            yield line[keep] + start, first[keep], last[keep]
+
+    def _vertex_lines(self, chunk, vertex, line, lo, hi, along):
+        # The even-odd rule is half-open at vertices, so a scanline through a vertex can miss boundary nodes (a whole
+        # edge lying along it, a touching corner). Those few lines are recomputed exactly, keeping boundary nodes.
+        exact = np.flatnonzero(vertex)
+        column_order = self.lazy.order == 'column'
+        spans = [_vertex_line_spans(self.polygon, chunk[index], along, column_order) for index in exact]
+        keep = ~np.isin(line, exact)
+        line = np.concatenate([line[keep]] + [np.full(len(s[0]), index) for index, s in zip(exact, spans)])
+        lo = np.concatenate([lo[keep]] + [s[0] for s in spans])
+        hi = np.concatenate([hi[keep]] + [s[1] for s in spans])
+        order = np.lexsort((lo, line))
+        return line[order], lo[order], hi[order]
+
+    def __len__(self):
+        if self._count is None:
+            self._count = int(sum((last - first + 1).sum() for _, first, last in self.spans()))
+        return self._count
+
+    @property
+    def meta(self):
+        # No lattice shape: writers treat the clipped grid as a plain list of nodes
+        meta = self.lazy.meta
+        del meta['shape']
+        meta.update(count=len(self), clipped=True)
+        return meta
+
+    def iter_blocks(self, nodes=1 << 16, dtype=None):
+        # Yields the nodes inside the polygon in grid order, in blocks of about `nodes` nodes (a chunk of scanlines
+        # can hold the whole grid, so its spans are cut at node counts, mid-span where needed)
+        lines, along = self._scan_axes()
+        dtype = self.lazy.dtype if dtype is None else dtype
+        scan, span = (0, 1) if self.lazy.order == 'column' else (1, 0)
+        nodes = max(1, int(nodes))
+        for line, first, last in self.spans():
+            ends = np.cumsum(last - first + 1)  # Node count up to and including each span
+            total = int(ends[-1]) if ends.size else 0
+            offsets = ends - (last - first + 1)
+            for start in range(0, total, nodes):
+                position = np.arange(start, min(start + nodes, total))
+                owner = np.searchsorted(ends, position, side='right')  # Span holding each node
+                block = np.empty((position.size, 2), dtype=dtype)
+                block[:, scan] = lines[line[owner]]
+                block[:, span] = along[first[owner] + position - offsets[owner]]
+                yield block
+
+    def to_numpy(self):
+        blocks = list(self.iter_blocks())
+        return np.concatenate(blocks) if blocks else np.empty((0, 2), dtype=self.lazy.dtype)
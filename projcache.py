@@ -0,0 +1,97 @@
+"""
+NAME:           projcache.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Bounded, thread-safe least-recently-used cache of pyproj CRS and Transformer objects keyed by EPSG
+id (pair), so repeated grid jobs sharing the same coordinate systems only query the PROJ database once per process.
+Hit, miss and eviction counters are kept for each kind of object.
+
+TO RUN:
+    -   Imported by pocketgrid.py, backpackgrid.py and batchgrid.py. Use the module level helpers:
+          -  get_crs(epsg)
+          -  get_transformer(in_epsg, out_epsg) - always_xy=True, as used throughout this repo
+          -  stats() - {'crs': {...}, 'transformer': {...}} hit/miss/eviction counts and current size
+
+DATA FORMAT:    EPSG identifiers (anything CRS.from_user_input accepts)
+
+REQUIRES:       threading, collections, pyproj
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, factory, maxsize=64):
+        self.factory = factory
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, *key):
+        with self._lock:  # Held while building too, so concurrent misses on one key build it once
+            if key in self._items:
+                self.hits += 1
+                self._items.move_to_end(key)
+                return self._items[key]
+            self.misses += 1
+            value = self.factory(*key)
+            self._items[key] = value
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.evictions += 1
+            return value
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._items),
+                    'maxsize': self.maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+def _build_crs(epsg):
+    from pyproj import CRS  # pyproj is only loaded once a coordinate system is actually needed
+    return CRS.from_user_input(epsg)
+
+
+def _build_transformer(in_epsg, out_epsg):
+    from pyproj import Transformer
+    return Transformer.from_crs(get_crs(in_epsg), get_crs(out_epsg), always_xy=True)
+
+
+_crs_cache = LRUCache(_build_crs)
+_transformer_cache = LRUCache(_build_transformer)
+
+
+def get_crs(epsg):
+    return _crs_cache.get(epsg)
+
+
+def get_transformer(in_epsg, out_epsg):
+    return _transformer_cache.get(in_epsg, out_epsg)
+
+
+def stats():
+    return {'crs': _crs_cache.stats(), 'transformer': _transformer_cache.stats()}
+
+
+def clear():
+    _crs_cache.clear()
+    _transformer_cache.clear()
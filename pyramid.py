@@ -0,0 +1,110 @@
+"""
+NAME:           pyramid.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Multi-resolution grid pyramid for nested models. The input is read and its corners transformed once,
+then every spacing in the list becomes one level, all aligned to the same SW origin, so with spacings that halve
+(500, 250, 125, 62.5) every coarse node is also a node of each finer level. Alongside each level below the coarsest
+a parent array gives, for every fine node, the index of its parent node on the next coarser level: the coarse node
+at or to the SW of it, i.e. the corner of the coarse cell containing it. Coarse-to-fine interpolation then becomes
+plain array indexing (coarse_values[parent]).
+
+TO RUN:
+    -   Call pocketgrid.grid_pyramid(in_path, out_path, spacings=(500, 250, 125, 62.5)), or build one directly:
+          -  levels(sw, ne, spacings) - one LazyGrid per spacing, coarsest first
+          -  parent_index(fine, coarse) - parent array for a pair of levels (LazyGrid or ClippedGrid)
+          -  write_pyramid(levels, out_path) - level outputs, parent arrays and an index file
+
+DATA FORMAT:    Level outputs are <out root>_<spacing><ext> in any gridwriters format and parent arrays
+<out root>_<spacing>_parent.npy (int64, -1 where a clipped parent is outside the polygon). <out root>_pyramid.json
+lists the spacing, node count, output and parent file of each level.
+
+REQUIRES:       json, os, numpy, gridwriters, lazygrid, polyclip
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import json
+import os
+import numpy as np
+import gridwriters
+from lazygrid import LazyGrid
+from polyclip import ClippedGrid
+
+
+def level_path(out_path, spacing, suffix=None):
+    root, ext = gridwriters.split_extension(out_path)
+    return f"{root}_{spacing:g}{ext}" if suffix is None else f"{root}_{spacing:g}{suffix}"
+
+
+def index_path(out_path):
+    return f"{gridwriters.split_extension(out_path)[0]}_pyramid.json"
+
+
+def levels(sw, ne, spacings, epsg=None, dtype=np.float64, order='column'):
+    # One LazyGrid per spacing, coarsest first, all starting at the same SW origin
+    spacings = sorted(set(spacings), reverse=True)
+    if not spacings or spacings[-1] <= 0:
+        raise ValueError("spacings must be a non-empty list of positive numbers")
+    return [LazyGrid.from_corners(sw, ne, spacing, epsg=epsg, dtype=dtype, order=order) for spacing in spacings]
+
+
+def _lattice(level):
+    return level.lazy if isinstance(level, ClippedGrid) else level
+
+
+def _parent_lines(count, fine_spacing, coarse_spacing, coarse_count):
+    # Coarse lattice line at or below each fine line; the small tolerance absorbs rounding of non-binary ratios
+    ratio = fine_spacing / coarse_spacing
+    return np.minimum(np.floor(np.arange(count) * ratio + 1e-9), coarse_count - 1).astype(np.int64)
+
+
+def parent_index(fine, coarse):
+    # For every node of fine, the index of the coarse node at or to the SW of it (the coarse cell's corner). With
+    # clipped levels the index is into the clipped coarse nodes, -1 where that parent lies outside the polygon.
+    fine_lattice, coarse_lattice = _lattice(fine), _lattice(coarse)
+    parent_column = _parent_lines(fine_lattice.columns, fine_lattice.spacing, coarse_lattice.spacing,
+                                  coarse_lattice.columns)
+    parent_row = _parent_lines(fine_lattice.rows, fine_lattice.spacing, coarse_lattice.spacing, coarse_lattice.rows)
+    if isinstance(fine, ClippedGrid):
+        nodes = fine.to_numpy()
+        column, row = fine_lattice.lattice_index(nodes[:, 0], nodes[:, 1])
+        parent = coarse_lattice._join(parent_column[column], parent_row[row])
+    elif fine_lattice.order == 'column':
+        parent = coarse_lattice._join(parent_column[:, None], parent_row[None, :]).ravel()
+    else:
+        parent = coarse_lattice._join(parent_column[None, :], parent_row[:, None]).ravel()
+    if isinstance(coarse, ClippedGrid):  # Lattice index -> position among the kept coarse nodes
+        kept = coarse.to_numpy()
+        position = np.full(len(coarse_lattice), -1, dtype=np.int64)
+        position[coarse_lattice.index(kept[:, 0], kept[:, 1])] = np.arange(len(kept))
+        parent = position[parent]
+    return parent
+
+
+def write_pyramid(grids, out_path, fmt=None, dtype=np.float64, precision=6):
+    # Writes every level and its parent array plus <out root>_pyramid.json; returns the list of level entries
+    fmt = gridwriters.output_format(out_path, fmt)
+    entries = []
+    for n, level in enumerate(grids):
+        spacing = _lattice(level).spacing
+        path = level_path(out_path, spacing)
+        gridwriters.write(path, level.iter_blocks(dtype=np.float64), level.meta, fmt=fmt, dtype=dtype,
+                          precision=precision)
+        entry = {'spacing': spacing, 'count': len(level), 'path': os.path.basename(path), 'parent': None}
+        if n > 0:
+            parent_path = level_path(out_path, spacing, '_parent.npy')
+            np.save(parent_path, parent_index(level, grids[n - 1]))
+            entry['parent'] = os.path.basename(parent_path)
+        entries.append(entry)
+    with open(index_path(out_path), 'w') as of:
+        json.dump({'meta': _lattice(grids[0]).meta, 'format': fmt, 'levels': entries}, of, indent=2)
+    return entries
@@ -0,0 +1,140 @@
+"""
+NAME:           quadtree.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Adaptive grid refined quadtree-style near the input polygon's boundary (or a supplied line layer such
+as a shoreline) down to a minimum spacing, so the fine resolution needed along edges is not spent on the open interior.
+Level 0 is the regular lattice at the coarse spacing. Every cell at level l that comes within `buffer` of an edge is
+split in four; the nodes that split adds (edge midpoints and centre) form level l + 1. Only the children of refined
+cells are tested at the next level, against an STRtree of the edge segments, so the work grows with the number of
+refined nodes rather than with the area at the finest spacing. Node positions are integer steps of the finest
+spacing from the common origin, so nodes shared between levels are emitted exactly once and level 0 matches
+pocketgrid.grid at the coarse spacing.
+
+TO RUN:
+    -   Call pocketgrid.adaptive_grid(in_path, out_path, grid_spacing=500, min_spacing=62.5), or build one directly:
+          -  QuadtreeGrid(lazy, edges, min_spacing, buffer=0.0, polygon=None) - lazy is the level 0 LazyGrid, edges a
+                shapely geometry (polygon boundaries and/or lines) in the same CRS, polygon optionally clips the nodes
+
+DATA FORMAT:    Returns (n, 3) numpy arrays of easting,northing,level, level by level and in grid order within each
+level; written with a level column by any gridwriters format
+
+REQUIRES:       numpy, shapely, lazygrid
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import numpy as np
+
+CHILD_NODES = np.array([[1, 0], [0, 1], [1, 1], [2, 1], [1, 2]])  # New nodes of a split cell, in half-cell steps
+CHILD_CELLS = np.array([[0, 0], [0, 1], [1, 0], [1, 1]])
+
+
+def edge_segments(geometry):
+    # (n, 4) x0, y0, x1, y1 of every straight edge of the polygon boundaries and lines in geometry
+    import shapely
+    parts = shapely.get_parts(geometry)
+    polygonal = shapely.get_type_id(parts) == 3
+    lines = np.concatenate([shapely.get_rings(parts[polygonal]), parts[~polygonal]])
+    lines = shapely.get_parts(lines[shapely.get_type_id(lines) != 0])  # Multi-lines to lines, points dropped
+    coords, line = shapely.get_coordinates(lines, return_index=True)
+    same_line = line[1:] == line[:-1]
+    return np.column_stack((coords[:-1][same_line], coords[1:][same_line]))
+
+
+def levels_for(spacing, min_spacing):
+    # Number of halvings of spacing that stay at or above min_spacing
+    if min_spacing <= 0 or min_spacing > spacing:
+        raise ValueError("min_spacing must be positive and no larger than the coarse grid spacing")
+    return int(np.floor(np.log2(spacing / min_spacing) + 1e-9))
+
+
+class QuadtreeGrid:
+    def __init__(self, lazy, edges, min_spacing, buffer=0.0, polygon=None):
+        import shapely
+        self.lazy = lazy
+        self.levels = levels_for(lazy.spacing, min_spacing)
+        self.step = lazy.spacing / 2 ** self.levels  # Finest spacing; node positions are integer multiples of it
+        self.buffer = buffer
+        self.polygon = polygon
+        segments = edge_segments(edges)
+        self._tree = shapely.STRtree(shapely.linestrings(segments.reshape(-1, 2, 2)))
+        self._nodes = None
+        self._count = None
+
+    def _near_edges(self, cells, size):
+        # Mask of the cells (SW corner in finest steps, side `size` steps) within buffer of any edge segment
+        import shapely
+        x0 = self.lazy.origin[0] + cells[:, 0] * self.step - self.buffer
+        y0 = self.lazy.origin[1] + cells[:, 1] * self.step - self.buffer
+        extent = size * self.step + 2 * self.buffer
+        hits = self._tree.query(shapely.box(x0, y0, x0 + extent, y0 + extent), predicate='intersects')[0]
+        near = np.zeros(len(cells), dtype=bool)
+        near[hits] = True
+        return near
+
+    def _build(self):
+        # Integer (column, row) node positions in finest steps for each level, sorted column-major like the lattice
+        scale = 2 ** self.levels
+        column, row = np.divmod(np.arange(len(self.lazy)), self.lazy.rows)
+        nodes = [np.column_stack((column, row)) * scale]
+        if self.lazy.columns < 2 or self.lazy.rows < 2:
+            return nodes
+        column, row = np.divmod(np.arange((self.lazy.columns - 1) * (self.lazy.rows - 1)), self.lazy.rows - 1)
+        cells = np.column_stack((column, row)) * scale
+        size = scale
+        for _ in range(self.levels):
+            if len(cells) == 0:
+                break
+            cells = cells[self._near_edges(cells, size)]
+            half = size // 2
+            added = (cells[:, None, :] + CHILD_NODES[None, :, :] * half).reshape(-1, 2)
+            key = np.unique(added[:, 0] * (self.lazy.rows * scale) + added[:, 1])  # Shared midpoints kept once
+            nodes.append(np.column_stack(np.divmod(key, self.lazy.rows * scale)))
+            cells = (cells[:, None, :] + CHILD_CELLS[None, :, :] * half).reshape(-1, 2)
+            size = half
+        return nodes
+
+    def _level_nodes(self):
+        if self._nodes is None:
+            self._nodes = self._build()
+        return self._nodes
+
+    def iter_blocks(self, dtype=None):
+        # Yields one (n, 3) easting,northing,level block per level, coarsest first
+        import shapely
+        dtype = self.lazy.dtype if dtype is None else dtype
+        for level, steps in enumerate(self._level_nodes()):
+            block = np.empty((len(steps), 3), dtype=dtype)
+            block[:, 0] = self.lazy.origin[0] + steps[:, 0] * self.step
+            block[:, 1] = self.lazy.origin[1] + steps[:, 1] * self.step
+            block[:, 2] = level
+            if self.polygon is not None:
+                block = block[shapely.intersects_xy(self.polygon, block[:, 0], block[:, 1])]  # Keeps boundary nodes
+            yield block
+
+    def __len__(self):
+        if self._count is None:
+            if self.polygon is None:
+                self._count = sum(len(steps) for steps in self._level_nodes())
+            else:  # Clipping is only known once the nodes are tested
+                self._count = sum(len(block) for block in self.iter_blocks())
+        return self._count
+
+    @property
+    def meta(self):
+        # Irregular node set: no lattice shape, a level column written as an integer in plaintext
+        return {'epsg': self.lazy.epsg, 'origin': list(self.lazy.origin), 'spacing': self.lazy.spacing,
+                'min_spacing': self.step, 'count': len(self), 'order': self.lazy.order, 'adaptive': True,
+                'columns': ['easting', 'northing', 'level'], 'column_precision': {'level': 0}}
+
+    def to_numpy(self):
+        return np.concatenate(list(self.iter_blocks()))
@@ -0,0 +1,93 @@
+"""
+NAME:           reproject.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Bulk reprojection of grid nodes into extra coordinate columns (lon/lat, or any second CRS). Each block
+of easting,northing is transformed in place as a few large array calls on one cached pyproj Transformer, on a thread
+pool (PROJ releases the GIL while transforming): grid-sized blocks run concurrently a few blocks ahead of the writer,
+larger blocks are split into chunks across the pool. The widened blocks are passed straight on to the output writer
+with no per-point Python objects.
+
+TO RUN:
+    -   Call pocketgrid.grid(..., extra_epsg=4326) or gridcli.py --extra-epsg 4326, or use directly:
+          -  add_columns(blocks, meta, extra_epsg) - widened block generator and metadata for gridwriters.write
+          -  transform_block(block, transformer) - (n, 2) reprojected copy of one block
+
+DATA FORMAT:    (n, 2) numpy arrays of easting,northing in; (n, 4) arrays of easting,northing,x,y out
+
+REQUIRES:       os, collections, concurrent.futures, numpy, projcache (pyproj)
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import projcache
+
+TRANSFORM_CHUNK = 1 << 16  # Nodes per transform call; large enough to amortise the call, small enough to spread
+
+
+def column_names(extra_epsg):
+    # Geographic WGS84 gets the familiar lon/lat names, anything else is labelled with its EPSG id
+    return ['lon', 'lat'] if extra_epsg == 4326 else [f"x_{extra_epsg}", f"y_{extra_epsg}"]
+
+
+def transform_block(block, transformer, pool=None, chunk=TRANSFORM_CHUNK):
+    # Reprojects the first two columns of an (n, k) block; chunks run on pool when one is given
+    xy = np.array(np.asarray(block)[:, :2].T, dtype=np.float64, order='C')  # Contiguous x and y rows
+    spans = [slice(start, start + chunk) for start in range(0, xy.shape[1], chunk)]
+
+    def run(span):
+        xy[0, span], xy[1, span] = transformer.transform(xy[0, span], xy[1, span], inplace=True)
+
+    if pool is None or len(spans) < 2:
+        for span in spans:
+            run(span)
+    else:
+        list(pool.map(run, spans))
+    return xy.T
+
+
+def _widen(block, transformer, pool=None, chunk=TRANSFORM_CHUNK):
+    out = np.empty((len(block), 4), dtype=np.asarray(block).dtype)
+    out[:, :2] = block
+    out[:, 2:] = transform_block(block, transformer, pool, chunk)
+    return out
+
+
+def add_columns(blocks, meta, extra_epsg, workers=None, chunk=TRANSFORM_CHUNK):
+    # (blocks, meta) with every block widened by the node coordinates in extra_epsg, for gridwriters.write. Grid
+    # blocks are about one chunk each, so whole blocks run concurrently on the pool, at most two per thread ahead of
+    # the writer; a block of several chunks is split across the pool instead. Blocks come out in order.
+    if meta.get('epsg') is None:
+        raise ValueError("The grid has no EPSG id to reproject from")
+    transformer = projcache.get_transformer(meta['epsg'], extra_epsg)
+    meta = dict(meta, columns=['easting', 'northing'] + column_names(extra_epsg), extra_epsg=extra_epsg)
+    workers = workers or os.cpu_count() or 1
+
+    def widened():
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for block in blocks:
+                if len(block) > chunk:  # Split across the pool; earlier blocks go out first to keep the order
+                    while pending:
+                        yield pending.popleft().result()
+                    yield _widen(block, transformer, pool, chunk)
+                    continue
+                pending.append(pool.submit(_widen, block, transformer, None, chunk))
+                while len(pending) > 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    return widened(), meta
@@ -0,0 +1,59 @@
+"""
+NAME:           test_gridinput.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Regression cases for the GeoJSON bounds scan of gridinput.py: inputs the scan once got wrong without
+an error, checked against the bounds geopandas reports for the same files.
+
+TO RUN:
+    -   python -m pytest tests
+
+DATA FORMAT:    Small GeoJSON files written to a temporary folder
+
+REQUIRES:       json, pytest, numpy, shapely, pyogrio (GeometryCollection input)
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gridinput  # noqa: E402
+
+SQUARE = {'type': 'Polygon', 'coordinates': [[[-95, 25], [-90, 25], [-90, 30], [-95, 30], [-95, 25]]]}
+
+
+def _write(folder, feature):
+    path = folder / 'input.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': [feature]}))
+    return path
+
+
+def test_geometry_collection_bounds_cover_every_member(tmp_path):
+    pytest.importorskip('pyogrio')
+    collection = {'type': 'GeometryCollection', 'geometries': [{'type': 'Point', 'coordinates': [-95, 25]}, SQUARE]}
+    feature = gridinput.InputFeature(_write(tmp_path, {'type': 'Feature', 'properties': {}, 'geometry': collection}))
+    assert feature.bounds == (-95.0, 25.0, -90.0, 30.0)
+    assert feature.geometry.bounds == (-95.0, 25.0, -90.0, 30.0)
+
+
+def test_geometry_in_properties_is_not_the_feature_geometry(tmp_path):
+    properties = {'geometry': {'type': 'Point', 'coordinates': [0, 0]}, 'note': 'a "quoted" } ] \\ value'}
+    feature = gridinput.InputFeature(_write(tmp_path, {'type': 'Feature', 'properties': properties,
+                                                       'geometry': SQUARE}))
+    assert feature.bounds == (-95.0, 25.0, -90.0, 30.0)
+    assert feature.geometry.geom_type == 'Polygon'
+    assert feature.geometry.bounds == (-95.0, 25.0, -90.0, 30.0)
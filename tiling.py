@@ -0,0 +1,211 @@
+"""
+NAME:           tiling.py
+
+COMPATIBILITY:  Python 3.10
+
+DESCRIPTION:    Deterministic tiled generation of one grid across several machines. The lattice is cut into fixed
+tiles of tile_nodes x tile_nodes nodes by lattice index, so tiles never overlap and every node belongs to exactly one
+tile; tile IDs are the lattice indices of each tile's first node (c<column>r<row>) and do not depend on how many
+machines run the job. Tiles are dealt round-robin to N shards, shard i writes only its own tiles plus an index file,
+and merge() stitches the tiles of all shards back into exactly the grid a single pocketgrid.grid run would write.
+Tile nodes are sliced from the full grid's axis vectors, so seams carry no rounding differences.
+
+TO RUN:
+    -   Each machine runs its shard (0-based, i of N):
+          -  python gridcli.py --in-path boundingbox.geojson --out-path grid.npy --shard 0/4 [--tile-size 1024]
+          -  or pocketgrid.tile_grid(in_path, out_path, shard=0, shards=4)
+    -   Then, with all shard outputs in one folder:
+          -  python tiling.py merge grid.npy grid_shard*-of-4.json - or merge(index_paths, out_path)
+
+DATA FORMAT:    Tiles are named <out root>_<tile id><ext> in any gridwriters format. The index of each shard
+(<out root>_shard<i>-of-<N>.json) records the full lattice, the output metadata and each tile's ID, lattice offset,
+shape, node count and file name.
+
+REQUIRES:       argparse, glob, json, os, sys, warnings, numpy, gridwriters, lazygrid, polyclip, reproject
+
+TODO:           N/A
+
+AUTHOR:         Harris Bienn
+
+ORGANIZATION:   The Water Institute of The Gulf
+
+CONTACT:        hbienn@thewaterinstitute.org
+
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import warnings
+import numpy as np
+import gridwriters
+import reproject
+from lazygrid import LazyGrid
+from polyclip import ClippedGrid
+
+TILE_NODES = 1024  # Lattice columns and rows per tile; about a million nodes each
+
+
+class Tile(LazyGrid):
+    # One tile of a LazyGrid: columns column..column+columns-1 and rows row..row+rows-1 of the full lattice. Axis
+    # values are sliced from the full lattice's axes rather than recomputed from the tile's own origin.
+    def __init__(self, lazy, column, row, columns, rows):
+        origin = (lazy.origin[0] + column * lazy.spacing, lazy.origin[1] + row * lazy.spacing)
+        super().__init__(origin, lazy.spacing, (columns, rows), epsg=lazy.epsg, dtype=lazy.dtype, order=lazy.order)
+        self.lazy = lazy
+        self.column, self.row = column, row
+
+    @property
+    def id(self):
+        return f"c{self.column}r{self.row}"
+
+    @property
+    def meta(self):
+        # Full lattice origin plus the tile's offset into it, so writers rebuild the same axis values
+        return dict(self.lazy.meta, shape=[self.columns, self.rows], count=len(self), offset=[self.column, self.row],
+                    tile=self.id)
+
+    def axes(self):
+        xs, ys = self.lazy.axes()
+        return xs[self.column:self.column + self.columns], ys[self.row:self.row + self.rows]
+
+
+def tiles(lazy, tile_nodes=TILE_NODES):
+    # Every tile of the lattice in grid order (tile columns outer for column order, tile rows outer for row order)
+    column_starts = range(0, lazy.columns, tile_nodes)
+    row_starts = range(0, lazy.rows, tile_nodes)
+    if lazy.order == 'column':
+        starts = [(column, row) for column in column_starts for row in row_starts]
+    else:
+        starts = [(column, row) for row in row_starts for column in column_starts]
+    return [Tile(lazy, column, row, min(tile_nodes, lazy.columns - column), min(tile_nodes, lazy.rows - row))
+            for column, row in starts]
+
+
+def parse_shard(text):
+    # "i/N" -> (i, N) with 0 <= i < N
+    try:
+        shard, shards = (int(part) for part in str(text).split('/'))
+    except ValueError:
+        raise ValueError(f"shard must look like i/N, not {text!r}") from None
+    if not 0 <= shard < shards:
+        raise ValueError(f"shard index must be in 0..{shards - 1}, not {shard}")
+    return shard, shards
+
+
+def shard_tiles(all_tiles, shard=0, shards=1):
+    # Round-robin over the tile order, so every shard gets a similar share of the domain
+    return all_tiles[shard::shards]
+
+
+def tile_path(out_path, tile_id):
+    root, ext = gridwriters.split_extension(out_path)
+    return f"{root}_{tile_id}{ext}"
+
+
+def index_path(out_path, shard=0, shards=1):
+    return f"{gridwriters.split_extension(out_path)[0]}_shard{shard}-of-{shards}.json"
+
+
+def write_tiles(lazy, out_path, tile_nodes=TILE_NODES, shard=0, shards=1, polygon=None, fmt=None,
+                dtype=np.float64, precision=6, extra_epsg=None, threads=None):
+    # Writes this shard's tiles and its index file; returns the index. polygon clips each tile like ClippedGrid.
+    fmt = gridwriters.output_format(out_path, fmt)
+    entries = []
+    for tile in shard_tiles(tiles(lazy, tile_nodes), shard, shards):
+        source = tile if polygon is None else ClippedGrid(tile, polygon)
+        blocks, meta = source.iter_blocks(dtype=np.float64), source.meta
+        if extra_epsg is not None:
+            blocks, meta = reproject.add_columns(blocks, meta, extra_epsg, workers=threads)
+        path = tile_path(out_path, tile.id)
+        gridwriters.write(path, blocks, meta, fmt=fmt, dtype=dtype, precision=precision)
+        entries.append({'id': tile.id, 'offset': [tile.column, tile.row], 'shape': [tile.columns, tile.rows],
+                        'count': len(source), 'path': os.path.basename(path)})
+    meta = lazy.meta
+    if polygon is not None:
+        del meta['shape']
+        meta['clipped'] = True
+    if extra_epsg is not None:
+        meta.update(columns=['easting', 'northing'] + reproject.column_names(extra_epsg), extra_epsg=extra_epsg)
+    index = {'lattice': lazy.meta, 'meta': meta, 'tile_nodes': tile_nodes, 'shard': shard, 'shards': shards,
+             'format': fmt, 'tiles': entries}
+    with open(index_path(out_path, shard, shards), 'w') as of:
+        json.dump(index, of, indent=2)
+    return index
+
+
+def _lattice(meta):
+    return LazyGrid(meta['origin'], meta['spacing'], meta['shape'], epsg=meta['epsg'], order=meta['order'])
+
+
+def _load_tile(folder, entry, fmt, width):
+    # The nodes of one tile output, checked against the node count its index recorded
+    path = os.path.join(folder, entry['path'])
+    if not os.path.exists(path):
+        raise ValueError(f"Tile {entry['id']} is listed in the index but {path} is missing")
+    with warnings.catch_warnings():  # A header-only CSV (tile outside the polygon) is expected to hold no data
+        warnings.simplefilter('ignore', UserWarning)
+        nodes = gridwriters.load(path, fmt)
+    if len(nodes) != entry['count']:
+        raise ValueError(f"Tile {entry['id']} has {len(nodes)} nodes in {path}; the index lists {entry['count']}")
+    return nodes if len(nodes) else np.empty((0, width))
+
+
+def _strips(indexes, folder):
+    # Yields the merged nodes one strip of tiles (a tile column in column order) at a time, in grid order
+    lattice, meta = indexes[0]['lattice'], indexes[0]['meta']
+    found = {entry['id']: entry for index in indexes for entry in index['tiles']}
+    fmt = indexes[0]['format']
+    along_axis = 0 if lattice['order'] == 'column' else 1  # Lattice axis whose index orders the nodes of a strip
+    strip = []
+    for tile in tiles(_lattice(lattice), indexes[0]['tile_nodes']) + [None]:
+        if strip and (tile is None or (tile.column, tile.row)[along_axis] != strip[0][0]):
+            width = len(gridwriters.column_names(meta))
+            nodes = np.concatenate([_load_tile(folder, entry, fmt, width) for _, entry in strip])
+            lines = np.rint((nodes[:, along_axis] - lattice['origin'][along_axis]) / lattice['spacing'])
+            yield nodes[np.argsort(lines, kind='stable')]  # Rows within a line keep their tile (ascending) order
+            strip = []
+        if tile is not None:
+            strip.append(((tile.column, tile.row)[along_axis], found[tile.id]))
+
+
+def merge(index_paths, out_path, fmt=None, dtype=np.float64, precision=6):
+    # Stitches the tiles listed by every shard's index into one output; checks that each tile is present once
+    indexes = []
+    for path in index_paths:
+        with open(path) as f:
+            indexes.append(json.load(f))
+    if not indexes:
+        raise ValueError("No tile index files to merge")
+    first = indexes[0]
+    for index in indexes[1:]:
+        if any(index[key] != first[key] for key in ('lattice', 'meta', 'tile_nodes', 'shards', 'format')):
+            raise ValueError("Tile indexes come from different grid jobs")
+    ids = [entry['id'] for index in indexes for entry in index['tiles']]
+    expected = {tile.id for tile in tiles(_lattice(first['lattice']), first['tile_nodes'])}
+    missing, extra = expected - set(ids), len(ids) - len(set(ids))
+    if missing or extra:
+        raise ValueError(f"Tiles missing: {sorted(missing)[:10]}; duplicated: {extra}")
+    meta = dict(first['meta'], count=sum(entry['count'] for index in indexes for entry in index['tiles']))
+    meta.pop('shape', None)  # Without a shape the writers read the tiles instead of rebuilding the lattice from meta
+    folder = os.path.dirname(os.path.abspath(index_paths[0]))
+    return gridwriters.write(out_path, _strips(indexes, folder), meta, fmt=fmt, dtype=dtype, precision=precision)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge the tiles written by sharded grid runs")
+    parser.add_argument('command', choices=['merge'])
+    parser.add_argument('out_path', help="merged output; the extension selects the format")
+    parser.add_argument('index_paths', nargs='+', help="shard index files (glob patterns are expanded)")
+    parser.add_argument('--precision', type=int, default=6)
+    parser.add_argument('--dtype', choices=['float32', 'float64'], default='float64')
+    args = parser.parse_args(argv)
+    paths = sorted({path for pattern in args.index_paths for path in (glob.glob(pattern) or [pattern])})
+    merge(paths, args.out_path, dtype=np.dtype(args.dtype), precision=args.precision)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())